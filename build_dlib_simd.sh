@@ -0,0 +1,90 @@
+#!/bin/bash
+# build_dlib_simd.sh - Rebuild dlib from source with SIMD (and CUDA if available)
+#
+# The generic dlib wheel leaves out the CPU-specific instruction sets, so every
+# face_recognition call in the views runs much slower than it has to. This
+# script replaces it with a build tuned for this machine.
+
+set -e
+
+# Colors
+GREEN='\033[0;32m'
+BLUE='\033[0;34m'
+YELLOW='\033[1;33m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo -e "${BLUE}⚙️  Rebuilding dlib for this CPU${NC}"
+echo "=============================================="
+
+# Check we're in faceenv
+if [[ "$VIRTUAL_ENV" != *"faceenv"* ]]; then
+    echo -e "${RED}❌ Please activate faceenv first${NC}"
+    echo "Run: source ../faceenv/bin/activate"
+    exit 1
+fi
+
+BUILD_OPTIONS=()
+ARCH=$(uname -m)
+
+if [[ "$ARCH" == "x86_64" ]]; then
+    if grep -q avx /proc/cpuinfo; then
+        echo -e "${GREEN}✅ AVX supported${NC}"
+        BUILD_OPTIONS+=(--set USE_AVX_INSTRUCTIONS=1)
+    else
+        echo -e "${YELLOW}⚠️  No AVX, falling back to SSE4${NC}"
+        BUILD_OPTIONS+=(--set USE_SSE4_INSTRUCTIONS=1)
+    fi
+    if grep -q avx512f /proc/cpuinfo; then
+        echo -e "${GREEN}✅ AVX-512 supported${NC}"
+        BUILD_OPTIONS+=(--compiler-flags "-O3 -march=native -mavx512f -mavx512bw")
+    else
+        BUILD_OPTIONS+=(--compiler-flags "-O3 -march=native")
+    fi
+elif [[ "$ARCH" == arm* || "$ARCH" == "aarch64" ]]; then
+    echo -e "${GREEN}✅ ARM build (NEON)${NC}"
+    BUILD_OPTIONS+=(--set USE_NEON_INSTRUCTIONS=1)
+    if [[ "$ARCH" == arm* ]]; then
+        # 32-bit ARM needs NEON enabled explicitly; it is implied on aarch64
+        BUILD_OPTIONS+=(--compiler-flags "-O3 -mfpu=neon")
+    else
+        BUILD_OPTIONS+=(--compiler-flags "-O3")
+    fi
+fi
+
+if command -v nvcc >/dev/null 2>&1; then
+    echo -e "${GREEN}✅ CUDA toolkit found, enabling DLIB_USE_CUDA${NC}"
+    BUILD_OPTIONS+=(--set DLIB_USE_CUDA=1)
+else
+    echo -e "${YELLOW}⚠️  No CUDA toolkit, building CPU-only${NC}"
+    BUILD_OPTIONS+=(--no DLIB_USE_CUDA)
+fi
+
+BUILD_DIR=$(mktemp -d)
+trap 'rm -rf "$BUILD_DIR"' EXIT
+
+echo -e "${YELLOW}📦 Downloading dlib source...${NC}"
+pip download dlib --no-binary :all: --no-deps --dest "$BUILD_DIR" --quiet
+tar -xzf "$BUILD_DIR"/dlib-*.tar.gz -C "$BUILD_DIR"
+
+echo -e "${YELLOW}🗑️  Removing installed dlib...${NC}"
+pip uninstall -y dlib 2>/dev/null || true
+
+echo -e "${YELLOW}🔨 Building dlib (this takes several minutes)...${NC}"
+echo "Options: ${BUILD_OPTIONS[*]}"
+(cd "$BUILD_DIR"/dlib-*/ && python setup.py install "${BUILD_OPTIONS[@]}")
+
+echo -e "${YELLOW}🔍 Verifying build...${NC}"
+python -c "
+import dlib
+print('✅ dlib:', dlib.__version__)
+print('   CUDA enabled:', dlib.DLIB_USE_CUDA)
+import face_recognition
+print('✅ face_recognition import successful')
+"
+
+echo -e "${GREEN}✅ dlib rebuilt!${NC}"
+echo ""
+echo -e "${BLUE}📋 Next steps:${NC}"
+echo "1. Restart the Django server so workers load the new dlib"
+echo "2. If CUDA is enabled, face encoding workers can be reduced (FACE_ENCODING_WORKERS)"
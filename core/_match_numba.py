@@ -0,0 +1,49 @@
+# core/_match_numba.py - Numba-compiled nearest face encoding search
+#
+# Importing this module requires numba; callers fall back to their NumPy paths
+# when it raises ImportError.
+
+import numpy as np
+from numba import get_num_threads, njit, prange
+
+@njit(parallel=True, fastmath=True, cache=True)
+def nearest_encoding(matrix, rows, encoding, max_squared_distance):
+    """
+    Find the row of matrix closest to encoding among the given row indices
+
+    Squared L2 distances are computed without copying the selected rows. The
+    rows are split into one slice per thread, and each slice is scanned as a
+    branch-and-bound search: a row is abandoned as soon as its running sum
+    passes the best distance found so far in the slice (initially
+    max_squared_distance), so most rows stop after a few dimensions.
+
+    Returns (position in rows, squared distance), or (-1, inf) when no row is
+    closer than max_squared_distance.
+    """
+    n_slices = min(get_num_threads(), rows.size)
+    slice_best = np.full(n_slices, -1, dtype=np.int64)
+    slice_distance = np.full(n_slices, np.inf)
+
+    for s in prange(n_slices):
+        start = rows.size * s // n_slices
+        stop = rows.size * (s + 1) // n_slices
+        cutoff = max_squared_distance
+        for k in range(start, stop):
+            i = rows[k]
+            total = 0.0
+            for j in range(matrix.shape[1]):
+                d = matrix[i, j] - encoding[j]
+                total += d * d
+                if total >= cutoff:
+                    break
+            if total < cutoff:
+                cutoff = total
+                slice_best[s] = k
+                slice_distance[s] = total
+
+    best = np.argmin(slice_distance)
+    return slice_best[best], slice_distance[best]
+
+# Compile at import so the first request doesn't pay for it
+nearest_encoding(np.zeros((1, 128), dtype=np.float32), np.zeros(1, dtype=np.int64),
+                 np.zeros(128, dtype=np.float32), 0.36)
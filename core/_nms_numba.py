@@ -0,0 +1,55 @@
+# core/_nms_numba.py - Numba-compiled IoU and NMS kernels for face filtering
+#
+# Importing this module requires numba; callers fall back to their NumPy paths
+# when it raises ImportError.
+
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def iou_xyxy(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+    """Intersection over Union of two (x1, y1, x2, y2) boxes, 0 when disjoint"""
+    x1_int = max(ax1, bx1)
+    y1_int = max(ay1, by1)
+    x2_int = min(ax2, bx2)
+    y2_int = min(ay2, by2)
+
+    if x2_int <= x1_int or y2_int <= y1_int:
+        return 0.0
+
+    intersection = (x2_int - x1_int) * (y2_int - y1_int)
+    union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - intersection
+
+    return intersection / union if union > 0 else 0.0
+
+@njit(cache=True)
+def nms_numba(boxes, scores, thr):
+    """
+    Greedy non-maximum suppression over an (N, 4) box array
+
+    Boxes are visited by descending score (stable for ties); a box is kept unless
+    its IoU with an already kept box exceeds thr. Returns kept indices as int32
+    in visiting order.
+    """
+    order = np.argsort(-scores, kind='mergesort')
+    keep = np.empty(order.size, dtype=np.int32)
+    kept_count = 0
+
+    for rank in range(order.size):
+        i = order[rank]
+        suppressed = False
+        for k in range(kept_count):
+            j = keep[k]
+            if iou_xyxy(boxes[i, 0], boxes[i, 1], boxes[i, 2], boxes[i, 3],
+                        boxes[j, 0], boxes[j, 1], boxes[j, 2], boxes[j, 3]) > thr:
+                suppressed = True
+                break
+        if not suppressed:
+            keep[kept_count] = i
+            kept_count += 1
+
+    return keep[:kept_count]
+
+# Compile at import so the first request doesn't pay for it
+nms_numba(np.zeros((1, 4)), np.zeros(1), 0.3)
+iou_xyxy(0, 0, 1, 1, 0, 0, 1, 1)
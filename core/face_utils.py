@@ -1,15 +1,63 @@
 # core/face_utils.py - Fixed version without circular import
 import face_recognition
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
 import numpy as np
 from keras_facenet import FaceNet
 from mtcnn.mtcnn import MTCNN
 import cv2
-from PIL import Image
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait as wait_for_futures
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ._encoding_worker import (
+    decode_and_encode, decode_image_data, encode_faces, init_worker, prepare_image,
+)
+
+try:
+    import hnswlib
+except ImportError:  # hnswlib is optional - matching falls back to the exact scan
+    hnswlib = None
+
+try:
+    from ._match_numba import nearest_encoding
+except ImportError:  # numba is optional - matching falls back to NumPy
+    nearest_encoding = None
+
+try:
+    import cupy
+    if not cupy.cuda.is_available():
+        cupy = None
+except ImportError:  # cupy is optional - matching stays on the CPU
+    cupy = None
+
+logger = logging.getLogger(__name__)
 # REMOVED: from .adaptive_detector import AdaptiveFaceDetector  # This was causing circular import
 
 # Initialize models only once
 FACENET_EMBEDDER = None
 MTCNN_DETECTOR = None
+ENCODING_POOL = None
+ENCODING_POOL_PID = None  # process that started ENCODING_POOL
+
+# Encoding workers start from a fresh interpreter rather than a fork of the
+# Django worker, which already has TensorFlow and background threads running;
+# their jobs live in _encoding_worker, which doesn't import either
+ENCODING_START_METHOD = (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+class EncodingTimeout(Exception):
+    """Face encoding didn't finish within FACE_ENCODING_TIMEOUT seconds"""
 
 
 def get_mtcnn_detector():
@@ -29,6 +77,132 @@ def get_facenet_embedder():
     return FACENET_EMBEDDER
 
 
+def get_encoding_pool():
+    """Process pool for face encodings, or None when FACE_ENCODING_WORKERS is 0"""
+    global ENCODING_POOL, ENCODING_POOL_PID
+    workers = getattr(settings, 'FACE_ENCODING_WORKERS', 0)
+    if ENCODING_POOL is not None and ENCODING_POOL_PID != os.getpid():
+        # Inherited through a fork (e.g. a preloading server master); its
+        # workers belong to the parent, so this process needs its own
+        ENCODING_POOL = None
+    if ENCODING_POOL is None and workers:
+        ENCODING_POOL = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker,
+            mp_context=multiprocessing.get_context(ENCODING_START_METHOD)
+        )
+        ENCODING_POOL_PID = os.getpid()
+    return ENCODING_POOL
+
+
+def _retire_encoding_pool(pool, grace):
+    """
+    Stop giving pool new jobs, and kill its workers after grace seconds
+    
+    Jobs other requests already submitted to pool still run. Each request waits
+    at most FACE_ENCODING_TIMEOUT for its jobs, so once grace (that timeout) has
+    passed nobody is waiting on the pool, and killing its workers frees the one
+    stuck on the timed-out job without failing anyone else's.
+    """
+    global ENCODING_POOL
+    if ENCODING_POOL is pool:
+        ENCODING_POOL = None
+    # ProcessPoolExecutor has no public way to stop a running job
+    processes = list((getattr(pool, '_processes', None) or {}).values())
+    pool.shutdown(wait=False)
+    timer = threading.Timer(grace, _terminate_processes, args=(processes,))
+    timer.daemon = True
+    timer.start()
+
+
+def _terminate_processes(processes):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def warm_up():
+    """
+    Load dlib now instead of on the first recognition request
+
+    Starts every encoding pool worker, each of which runs a dummy encoding in
+    its initializer, without waiting for them. Without a pool the dummy
+    encoding runs in this process. Importing this module has already compiled
+    the Numba kernels.
+    """
+    pool = get_encoding_pool()
+    if pool is None:
+        init_worker()
+        return
+    # Each queued job that finds no idle worker starts a new one
+    for _ in range(getattr(settings, 'FACE_ENCODING_WORKERS', 0)):
+        pool.submit(os.getpid)
+
+
+def _map_in_pool(function, args_list):
+    """
+    [function(*args) for args in args_list], computed in the encoding pool
+    
+    function must live in _encoding_worker so workers can import it cheaply.
+    Every job is submitted before any result is awaited, so several jobs are
+    spread over all workers. Falls back to running inline without a pool or if
+    a worker died. Raises EncodingTimeout if the jobs aren't all done within
+    FACE_ENCODING_TIMEOUT; new jobs then go to a fresh pool while the old one
+    is retired, so the stuck job doesn't keep holding a worker.
+    """
+    global ENCODING_POOL
+    pool = get_encoding_pool()
+    if pool is None:
+        return [function(*args) for args in args_list]
+        
+    timeout = getattr(settings, 'FACE_ENCODING_TIMEOUT', 30)
+    try:
+        futures = [pool.submit(function, *args) for args in args_list]
+        _, pending = wait_for_futures(futures, timeout=timeout)
+        if pending:
+            logger.warning("Face encoding took over %s seconds, replacing the pool", timeout)
+            for future in pending:
+                future.cancel()
+            _retire_encoding_pool(pool, grace=timeout)
+            raise EncodingTimeout(f"Face encoding took over {timeout} seconds")
+        return [future.result() for future in futures]
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool on the next call
+        logger.warning("Face encoding pool broke, encoding inline")
+        if ENCODING_POOL is pool:
+            ENCODING_POOL = None
+        return [function(*args) for args in args_list]
+
+
+def compute_face_encodings(image):
+    """
+    Face encodings for image, computed in the encoding pool
+    
+    dlib's detection and encoding hold the GIL for up to several seconds, so
+    running them in a worker process keeps the Django worker's other threads
+    responsive. Falls back to encoding inline without a pool or if it broke.
+    """
+    return _map_in_pool(encode_faces, [(image,)])[0]
+
+
+def encode_uploaded_images(image_files, max_side=800):
+    """
+    Face encodings for each uploaded image, in input order
+    
+    Decoding happens in the encoding pool along with detection and encoding,
+    so the request thread only reads the upload, and the compressed bytes
+    rather than the decoded pixels are what gets sent to the worker. An entry
+    is None when its image couldn't be decoded, and empty when it holds no face.
+    """
+    return _map_in_pool(
+        decode_and_encode, [(image_file.read(), max_side) for image_file in image_files]
+    )
+
+
+def encode_uploaded_image(image_file, max_side=800):
+    """encode_uploaded_images() for a single upload"""
+    return encode_uploaded_images([image_file], max_side)[0]
+
+
 def detect_and_align_face(image):
     """
     Use MTCNN to detect and align face from image.
@@ -46,33 +220,35 @@ def detect_and_align_face(image):
             return face_crop
         return None
     except Exception as e:
-        print(f"Face detection failed: {e}")
+        logger.warning("Face detection failed: %s", e)
         return None
 
 
-def preprocess_image(image_file):
+def preprocess_image(image_file, max_side=800):
     """
     Preprocess uploaded image for face recognition
+    
+    The image is downscaled with prepare_image() before it is returned.
     """
+    if hasattr(image_file, 'read'):
+        # File upload object
+        return decode_image_data(image_file.read(), max_side)
+        
     try:
-        if hasattr(image_file, 'read'):
-            # File upload object
-            image_data = image_file.read()
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        else:
-            # File path
-            image = cv2.imread(str(image_file))
-            
+        # File path
+        image = cv2.imread(str(image_file))
         if image is None:
             return None
             
+        # Shrink before the color conversion so it touches fewer pixels
+        image = prepare_image(image, max_side)
+            
         # Convert to RGB for face_recognition compatibility
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         return image_rgb
         
     except Exception as e:
-        print(f"Image preprocessing failed: {e}")
+        logger.warning("Image preprocessing failed: %s", e)
         return None
 
 
@@ -84,10 +260,364 @@ def compare_faces(known_encodings, face_encoding, tolerance=0.6):
         distances = face_recognition.face_distance(known_encodings, face_encoding)
         return distances <= tolerance
     except Exception as e:
-        print(f"Face comparison failed: {e}")
+        logger.warning("Face comparison failed: %s", e)
         return []
 
 
+# Stored encodings are float32 (512 bytes); rows saved before that are float64.
+# The byte length tells them apart, so both keep working without a migration.
+ENCODING_DTYPES_BY_SIZE = {128 * 4: np.float32, 128 * 8: np.float64}
+
+
+def encode_face_encoding(face_encoding):
+    """Serialize a face encoding for Student.face_encoding"""
+    return np.asarray(face_encoding, dtype=np.float32).tobytes()
+
+
+def decode_face_encoding(data):
+    """Deserialize a stored face encoding, or None if it is missing or malformed"""
+    dtype = ENCODING_DTYPES_BY_SIZE.get(len(data)) if data else None
+    if dtype is None:
+        return None
+    return np.frombuffer(data, dtype=dtype)
+
+
+# Every student's stored encoding as one (N, 128) matrix, so matching a face is a
+# single vectorized distance computation instead of one call per student. Rebuilt
+# whenever the students table's fingerprint changes (see get_encoding_matrix).
+# The arrays are replaced together as one snapshot tuple, so a thread matching
+# while another rebuilds never pairs one version's ids with another's matrix;
+# the HNSW index and GPU copy are stored with the snapshot they were built from.
+_encoding_cache = {
+    'version': None,
+    'checked_at': None,  # time.monotonic() of the last fingerprint query
+    # (ids, matrix, norms): norms is the Euclidean norm of each matrix row
+    'snapshot': (
+        np.zeros(0, dtype=np.int64),
+        np.zeros((0, 128), dtype=np.float32),
+        np.zeros(0, dtype=np.float32),
+    ),
+    'index': None,  # (snapshot, HNSW index over its matrix), built on first use
+    'gpu': None,  # (snapshot, (matrix, squared norms) on the GPU), on first use
+}
+
+# Candidate count from which matching queries the HNSW index (when hnswlib is
+# installed) instead of computing every distance
+ANN_MIN_CANDIDATES = 1000
+
+# Candidate count from which the compiled Numba scan beats the NumPy one
+NUMBA_MIN_CANDIDATES = 100
+
+# Candidate count from which matching runs exactly on the GPU (when cupy finds
+# one) instead of through the HNSW index or on the CPU
+GPU_MIN_CANDIDATES = 20000
+
+
+def _encoding_cache_version():
+    """
+    Cheap fingerprint of the students table
+    
+    Adding, deleting or re-saving a student changes it; attendance bookkeeping
+    saves with update_fields and leaves updated_at alone. Queried from the
+    database rather than bumped in-process so every worker sees the change.
+    """
+    # Import locally to avoid circular import
+    from django.db.models import Count, Max
+    from .models import Student
+    
+    stats = Student.objects.aggregate(
+        count=Count('id'), last_id=Max('id'), last_update=Max('updated_at')
+    )
+    return stats['count'], stats['last_id'], stats['last_update']
+
+
+def _shared_cache_dir():
+    """
+    FACE_ENCODING_CACHE_DIR if decrypted encodings may be written there, else None
+    
+    The files hold the encodings that are encrypted at rest in the database, so
+    the directory must be an absolute path outside the project, owned by this
+    user and closed to everyone else (mode 0700); it is created that way when
+    missing. A tmpfs such as /dev/shm also keeps them off disk.
+    """
+    cache_dir = getattr(settings, 'FACE_ENCODING_CACHE_DIR', None)
+    if not cache_dir:
+        return None
+    cache_dir = os.fspath(cache_dir)
+    project_dir = os.path.realpath(settings.BASE_DIR)
+    if not os.path.isabs(cache_dir):
+        reason = 'is not an absolute path'
+    elif os.path.commonpath([os.path.realpath(cache_dir), project_dir]) == project_dir:
+        reason = 'is inside the project directory'
+    else:
+        try:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            info = os.stat(cache_dir)
+        except OSError as e:
+            reason = f'is not usable ({e})'
+        else:
+            if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+                reason = 'is not owned by this user'
+            elif info.st_mode & 0o077:
+                reason = 'is open to other users (needs mode 0700)'
+            else:
+                return cache_dir
+    logger.warning("Not sharing face encodings: FACE_ENCODING_CACHE_DIR %s", reason)
+    return None
+
+
+def _shared_encoding_key(version):
+    """Short file-name-safe digest of a table version of this database"""
+    # Another project on the host can point at the same directory, and its
+    # students table can have the same fingerprint
+    identity = (connection.vendor, str(connection.settings_dict['NAME']), version)
+    return hashlib.sha1(repr(identity).encode()).hexdigest()[:16]
+
+
+def _shared_encoding_paths(cache_dir, version, stamp):
+    """
+    (matrix, ids) .npy paths in cache_dir for a table version
+    
+    stamp is the time.time_ns() taken just before the version was read; it is
+    part of the file names so a worker can tell which saved versions are older
+    than its own.
+    """
+    key = _shared_encoding_key(version)
+    return (
+        os.path.join(cache_dir, f'encodings_{stamp}_{key}.npy'),
+        os.path.join(cache_dir, f'encoding_ids_{stamp}_{key}.npy'),
+    )
+
+
+def _shared_encoding_stamp(path):
+    """The stamp in a shared encodings file name, or None for any other name"""
+    try:
+        return int(os.path.basename(path).rsplit('_', 2)[-2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _load_shared_encodings(cache_dir, version):
+    """Memory-map a saved (ids, matrix) pair for version, or return None if there is none"""
+    pattern = os.path.join(cache_dir, f'encodings_*_{_shared_encoding_key(version)}.npy')
+    for matrix_path in sorted(
+        glob.glob(pattern), key=lambda path: _shared_encoding_stamp(path) or 0, reverse=True
+    ):
+        ids_path = os.path.join(
+            cache_dir, 'encoding_ids_' + os.path.basename(matrix_path)[len('encodings_'):]
+        )
+        try:
+            return np.load(ids_path), np.load(matrix_path, mmap_mode='r')
+        except (OSError, ValueError):
+            # Includes FileNotFoundError: a newer version's writer may have
+            # removed the pair since the glob
+            continue
+    return None
+
+
+def _save_shared_encodings(paths, ids, matrix):
+    """
+    Save (ids, matrix) for other worker processes to memory-map
+    
+    Each file is written under a temporary name and renamed into place, so a
+    reader either sees a complete pair or falls back to the database. Files of
+    versions read before this one are removed, never newer ones another worker
+    may just have published; workers still mapping removed files keep their pages.
+    """
+    matrix_path, ids_path = paths
+    cache_dir = os.path.dirname(matrix_path)
+    stamp = _shared_encoding_stamp(matrix_path)
+    try:
+        for path, array in ((matrix_path, matrix), (ids_path, ids)):
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(temp_path, path)
+            
+        for path in glob.glob(os.path.join(cache_dir, 'encoding*.npy')):
+            other_stamp = _shared_encoding_stamp(path)
+            if other_stamp is None or other_stamp < stamp:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # another worker removed it first
+    except OSError as e:
+        logger.warning("Saving shared face encodings failed: %s", e)
+
+
+def get_encoding_matrix():
+    """
+    Return (student_ids, encodings, norms) for every student with a usable encoding
+    
+    encodings is an (N, 128) float32 matrix whose rows line up with student_ids,
+    and norms holds each row's Euclidean norm. The three always come from the
+    same table version.
+    Encodings are only decrypted and decoded again when the table has changed,
+    and then only by the first worker process to notice; the others memory-map
+    its copy from FACE_ENCODING_CACHE_DIR.
+    """
+    from .models import Student
+    
+    # Saves in this process invalidate the cache through the signals below;
+    # the fingerprint query only has to catch other processes' saves, so it
+    # runs at most once per FACE_ENCODING_CACHE_TTL seconds
+    now = time.monotonic()
+    checked_at = _encoding_cache['checked_at']
+    if checked_at is not None and now - checked_at < getattr(settings, 'FACE_ENCODING_CACHE_TTL', 0):
+        return _encoding_cache['snapshot']
+        
+    stamp = time.time_ns()
+    version = _encoding_cache_version()
+    _encoding_cache['checked_at'] = now
+    if _encoding_cache['version'] != version:
+        cache_dir = _shared_cache_dir()
+        paths = _shared_encoding_paths(cache_dir, version, stamp) if cache_dir else None
+        shared = _load_shared_encodings(cache_dir, version) if cache_dir else None
+        
+        if shared is not None:
+            ids, matrix = shared
+        else:
+            ids = []
+            # float32 bytes of every encoding, appended in place; the matrix is
+            # a view of this buffer, so no per-row array or stacking copy is made
+            buffer = bytearray()
+            # Stream rows instead of caching the whole result set alongside the matrix
+            rows = Student.objects.values_list('id', 'face_encoding').iterator(chunk_size=1000)
+            for student_id, encoding in rows:
+                # Skip missing or malformed encodings, as the per-student loop did
+                dtype = ENCODING_DTYPES_BY_SIZE.get(len(encoding)) if encoding else None
+                if dtype is None:
+                    continue
+                ids.append(student_id)
+                if dtype is np.float32:
+                    buffer += encoding
+                else:
+                    # Legacy float64 row
+                    buffer += np.frombuffer(encoding, dtype=dtype).astype(np.float32).tobytes()
+                    
+            ids = np.array(ids, dtype=np.int64)
+            matrix = np.frombuffer(buffer, dtype=np.float32).reshape(-1, 128)
+            if paths:
+                _save_shared_encodings(paths, ids, matrix)
+                
+        _encoding_cache.update(
+            version=version, snapshot=(ids, matrix, np.linalg.norm(matrix, axis=1)),
+            index=None, gpu=None
+        )
+        
+    return _encoding_cache['snapshot']
+
+
+@receiver(post_save, sender='core.Student')
+@receiver(post_delete, sender='core.Student')
+def _invalidate_encoding_cache(sender, instance, update_fields=None, **kwargs):
+    """Recheck the fingerprint on the next match after a student is saved or deleted"""
+    # Attendance bookkeeping saves only its own fields and can't change an encoding
+    if update_fields is None or 'face_encoding' in update_fields:
+        _encoding_cache['checked_at'] = None
+
+
+def find_closest_student(face_encoding, candidate_ids, tolerance=0.6):
+    """
+    Match a face encoding against the stored encodings of candidate_ids
+    
+    Returns (student_id, distance) of the closest student whose distance is
+    below tolerance, or (None, None) if there is none. Large candidate sets are
+    searched approximately through an HNSW index when hnswlib is installed, or
+    exactly on the GPU when cupy finds one and the set is larger still.
+    """
+    snapshot = get_encoding_matrix()
+    ids, matrix, norms = snapshot
+    candidate_ids = set(candidate_ids)
+    use_gpu = cupy is not None and len(candidate_ids) >= GPU_MIN_CANDIDATES
+    
+    if hnswlib is not None and len(candidate_ids) >= ANN_MIN_CANDIDATES and not use_gpu:
+        student_id, distance = _query_encoding_index(snapshot, face_encoding, candidate_ids)
+    else:
+        face_encoding = np.asarray(face_encoding, dtype=np.float32)
+        
+        # ||u - k|| >= |  ||u|| - ||k||  |, so students whose norm differs from
+        # the face's by tolerance or more can't match; skip them before the
+        # full 128-dimensional comparison
+        norm_gap = np.abs(norms - np.linalg.norm(face_encoding))
+        rows = np.flatnonzero((norm_gap < tolerance) & np.isin(ids, list(candidate_ids)))
+        if not rows.size:
+            return None, None
+            
+        if use_gpu:
+            best = _nearest_on_gpu(snapshot, rows, face_encoding)
+            distance = float(np.linalg.norm(matrix[rows[best]] - face_encoding))
+        elif nearest_encoding is not None and rows.size >= NUMBA_MIN_CANDIDATES:
+            best, squared_distance = nearest_encoding(matrix, rows, face_encoding, tolerance ** 2)
+            if best < 0:
+                return None, None
+            distance = float(np.sqrt(squared_distance))
+        else:
+            # ||k - u||^2 = ||k||^2 + ||u||^2 - 2 k.u with the cached norms, so
+            # ranking every row is one matrix-vector product instead of building
+            # an (N, 128) difference array; only the winner's distance is then
+            # recomputed directly, as face_recognition.face_distance would
+            squared_distances = (
+                np.square(norms[rows]) - 2 * (matrix[rows] @ face_encoding)
+            )
+            best = int(squared_distances.argmin())
+            distance = float(np.linalg.norm(matrix[rows[best]] - face_encoding))
+        student_id = int(ids[rows[best]])
+        
+    if student_id is not None and distance < tolerance:
+        return student_id, distance
+    return None, None
+
+
+def _nearest_on_gpu(snapshot, rows, face_encoding):
+    """
+    Position in rows of the snapshot encoding closest to face_encoding, ranked on the GPU
+    
+    Ranks by ||k||^2 - 2 k.u like the NumPy path, as one cuBLAS matrix-vector
+    product. The matrix is copied to the device once per cache version.
+    """
+    cached = _encoding_cache['gpu']
+    if cached is not None and cached[0] is snapshot:
+        gpu = cached[1]
+    else:
+        _, matrix, norms = snapshot
+        gpu = (cupy.asarray(matrix), cupy.asarray(np.square(norms)))
+        _encoding_cache['gpu'] = (snapshot, gpu)
+    matrix, squared_norms = gpu
+    
+    rows = cupy.asarray(rows)
+    scores = squared_norms[rows] - 2 * (matrix[rows] @ cupy.asarray(face_encoding))
+    return int(scores.argmin())
+
+
+def _query_encoding_index(snapshot, face_encoding, candidate_ids):
+    """Nearest candidate (student_id, distance) from the snapshot's HNSW index, or (None, None)"""
+    cached = _encoding_cache['index']
+    if cached is not None and cached[0] is snapshot:
+        index = cached[1]
+    else:
+        ids, matrix, _ = snapshot
+        index = hnswlib.Index(space='l2', dim=128)
+        index.init_index(max_elements=max(len(ids), 1), M=16, ef_construction=200)
+        if len(ids):
+            index.add_items(matrix, ids)
+        index.set_ef(64)
+        _encoding_cache['index'] = (snapshot, index)
+        
+    try:
+        labels, distances = index.knn_query(
+            np.asarray(face_encoding, dtype=np.float32), k=1,
+            filter=lambda label: label in candidate_ids
+        )
+    except RuntimeError:
+        # No indexed student passed the filter
+        return None, None
+        
+    # hnswlib's 'l2' space reports squared distances
+    return int(labels[0, 0]), float(np.sqrt(distances[0, 0]))
+
+
 def validate_image_quality(image):
     """
     Basic image quality validation
@@ -120,7 +650,7 @@ def detect_faces_hof_adaptive(image_file_or_path, return_metrics=False):
         detector = AdaptiveFaceDetector()
         return detector.detect_faces_adaptive(image_file_or_path, return_metrics)
     except Exception as e:
-        print(f"HOF adaptive detection failed: {e}")
+        logger.warning("HOF adaptive detection failed: %s", e)
         return [] if not return_metrics else ([], {})
 
 
@@ -224,11 +754,11 @@ def recognize_faces_with_hof(image_file_or_path, known_encodings, known_names, t
                         })
                         
             except Exception as e:
-                print(f"Recognition failed for face {i}: {e}")
+                logger.warning("Recognition failed for face %d: %s", i, e)
                 continue
                 
         return recognition_results
         
     except Exception as e:
-        print(f"HOF recognition failed: {e}")
+        logger.warning("HOF recognition failed: %s", e)
         return []
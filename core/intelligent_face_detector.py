@@ -238,18 +238,23 @@ class IntelligentFaceDetector:
         ), reverse=True)
         
         kept_faces = []
+        kept_bboxes = []
         
-        for face in sorted_faces:
+        # Unpack bboxes into tuples once instead of dict lookups for every pair
+        bboxes = [tuple(face['bbox']) for face in sorted_faces]
+        
+        for face, bbox in zip(sorted_faces, bboxes):
             # Check if this face overlaps significantly with any kept face
             overlaps = False
-            for kept_face in kept_faces:
-                overlap_ratio = self._calculate_overlap_ratio(face['bbox'], kept_face['bbox'])
+            for kept_bbox in kept_bboxes:
+                overlap_ratio = self._calculate_overlap_ratio(bbox, kept_bbox)
                 if overlap_ratio > overlap_threshold:
                     overlaps = True
                     break
                     
             if not overlaps:
                 kept_faces.append(face)
+                kept_bboxes.append(bbox)
                 
         return kept_faces
         
@@ -296,8 +301,12 @@ class IntelligentFaceDetector:
                 
             # Calculate quality metrics
             
+            # Brightness and contrast from a single OpenCV pass
+            mean, stddev = cv2.meanStdDev(gray_face)
+            mean_brightness = mean[0, 0]
+            contrast = stddev[0, 0]
+            
             # 1. Contrast (faces should have reasonable contrast)
-            contrast = np.std(gray_face)
             contrast_score = min(50, contrast)
             
             # 2. Edge density (faces have more edges than flat regions)
@@ -306,7 +315,6 @@ class IntelligentFaceDetector:
             edge_score = min(30, edge_density * 3000)
             
             # 3. Brightness distribution (not too dark/bright)
-            mean_brightness = np.mean(gray_face)
             brightness_score = 20 - abs(mean_brightness - 127) * 0.15
             brightness_score = max(0, brightness_score)
             
@@ -0,0 +1,20 @@
+# core/management/commands/purge_expired_sessions.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ActiveSession
+
+
+class Command(BaseCommand):
+    help = "Delete ActiveSession rows with no activity in the last --hours hours (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Idle time after which a session is purged (default: 24)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted, _ = ActiveSession.objects.filter(last_activity__lt=cutoff).delete()
+        self.stdout.write(f"Purged {deleted} expired sessions")
@@ -27,7 +27,7 @@ class ActivityLoggingMiddleware:
     def process_response(self, request, response):
         # Log activities based on the request
         if hasattr(request, 'user') and request.user.is_authenticated:
-            settings = SecuritySettings.get_settings()
+            settings = SecuritySettings.get_cached_settings()
             if settings.log_all_activities:  # Fixed: changed from track_user_activities
                 self.log_activity_from_request(request, response)
         return response
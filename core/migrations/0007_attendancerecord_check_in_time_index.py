@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-16 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_rename_core_timetab_academi_c8b2a1_idx_core_timeta_academi_da37d1_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['-check_in_time'], name='core_attend_check_in_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_attendancerecord_check_in_time_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['-timestamp'], name='core_useractivity_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['-timestamp'], name='core_loginattempt_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activesession',
+            index=models.Index(fields=['is_active', '-last_activity'], name='core_activesess_active_idx'),
+        ),
+    ]
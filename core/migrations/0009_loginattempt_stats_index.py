@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_security_log_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['timestamp', 'username', 'success'], name='core_loginattempt_stats_idx'),
+        ),
+    ]
@@ -10,6 +10,7 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import json
+import time
 import uuid  # This was missing - causing the error!
 import numpy as np  # Needed for face recognition processing
 
@@ -359,11 +360,16 @@ class Student(models.Model):
     
     def calculate_attendance_rate(self):
         """Calculate attendance rate for this student"""
-        total_records = self.attendance_records.count()
+        # Both counts in one query
+        counts = self.attendance_records.aggregate(
+            total=models.Count('id'),
+            present=models.Count('id', filter=models.Q(status__in=['present', 'late']))
+        )
+        total_records = counts['total']
         if total_records == 0:
             return 0.00
         
-        present_records = self.attendance_records.filter(status__in=['present', 'late']).count()
+        present_records = counts['present']
         rate = (present_records / total_records) * 100
         self.attendance_rate = round(rate, 2)
         self.save(update_fields=['attendance_rate'])
@@ -418,6 +424,8 @@ class AttendanceRecord(models.Model):
             models.Index(fields=['student', '-attendance_date']),
             models.Index(fields=['course', '-attendance_date']),
             models.Index(fields=['status', '-attendance_date']),
+            # Default ordering and check_in_time date-range filters
+            models.Index(fields=['-check_in_time'], name='core_attend_check_in_idx'),
         ]
     
     def save(self, *args, **kwargs):
@@ -494,6 +502,8 @@ class UserActivity(models.Model):
             models.Index(fields=['user', '-timestamp']),
             models.Index(fields=['action', '-timestamp']),
             models.Index(fields=['status', '-timestamp']),
+            # Unfiltered newest-first listing in get_user_activities
+            models.Index(fields=['-timestamp'], name='core_useractivity_ts_idx'),
         ]
     
     def __str__(self):
@@ -515,6 +525,10 @@ class LoginAttempt(models.Model):
             models.Index(fields=['username', '-timestamp']),
             models.Index(fields=['ip_address', '-timestamp']),
             models.Index(fields=['success', '-timestamp']),
+            # Newest-first listing in get_login_attempts
+            models.Index(fields=['-timestamp'], name='core_loginattempt_ts_idx'),
+            # Covers the security statistics aggregate, so it never reads the table
+            models.Index(fields=['timestamp', 'username', 'success'], name='core_loginattempt_stats_idx'),
         ]
     
     def __str__(self):
@@ -534,6 +548,10 @@ class ActiveSession(models.Model):
     
     class Meta:
         ordering = ['-last_activity']
+        indexes = [
+            # get_active_sessions filters on is_active, newest activity first
+            models.Index(fields=['is_active', '-last_activity'], name='core_activesess_active_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.session_key[:10]}..."
@@ -584,6 +602,31 @@ class SecuritySettings(models.Model):
         """Get or create security settings (singleton pattern)"""
         settings, created = cls.objects.get_or_create(pk=1)
         return settings
+    
+    @classmethod
+    def get_cached_settings(cls):
+        """
+        get_settings(), reused for up to SECURITY_SETTINGS_CACHE_TTL seconds
+        
+        For per-request reads such as the activity logging middleware. Saves in
+        this process clear the cache right away (see the post_save receiver
+        below); saves in other worker processes are seen once the TTL expires.
+        """
+        now = time.monotonic()
+        loaded_at = _security_settings_cache['loaded_at']
+        if loaded_at is None or now - loaded_at >= SECURITY_SETTINGS_CACHE_TTL:
+            _security_settings_cache.update(settings=cls.get_settings(), loaded_at=now)
+        return _security_settings_cache['settings']
+    
+    @classmethod
+    def clear_cached_settings(cls):
+        """Make the next get_cached_settings() call in this process read the row"""
+        _security_settings_cache['loaded_at'] = None
+
+# Seconds a worker reuses its SecuritySettings row before reading it again
+SECURITY_SETTINGS_CACHE_TTL = 60
+
+_security_settings_cache = {'settings': None, 'loaded_at': None}
 
 class SystemSettings(models.Model):
     """Global system configuration"""
@@ -681,6 +724,32 @@ class SystemSettings(models.Model):
         """Get or create system settings (singleton pattern)"""
         settings, created = cls.objects.get_or_create(pk=1)
         return settings
+    
+    @classmethod
+    def get_cached_settings(cls):
+        """
+        The saved settings row, or None before one exists, reused for up to
+        SYSTEM_SETTINGS_CACHE_TTL seconds
+        
+        Unlike get_settings() this never creates the row, so readers can still
+        tell an unconfigured system apart. Cleared on save like the security
+        settings cache.
+        """
+        now = time.monotonic()
+        loaded_at = _system_settings_cache['loaded_at']
+        if loaded_at is None or now - loaded_at >= SYSTEM_SETTINGS_CACHE_TTL:
+            _system_settings_cache.update(settings=cls.objects.first(), loaded_at=now)
+        return _system_settings_cache['settings']
+    
+    @classmethod
+    def clear_cached_settings(cls):
+        """Make the next get_cached_settings() call in this process read the row"""
+        _system_settings_cache['loaded_at'] = None
+
+# Seconds a worker reuses its SystemSettings row before reading it again
+SYSTEM_SETTINGS_CACHE_TTL = 60
+
+_system_settings_cache = {'settings': None, 'loaded_at': None}
 
 class SystemBackup(models.Model):
     filename = models.CharField(max_length=200)
@@ -924,6 +993,16 @@ def update_attendance_rate_signal(sender, instance, created, **kwargs):
     if created:
         instance.student.calculate_attendance_rate()
 
+@receiver(post_save, sender=SecuritySettings)
+def clear_security_settings_cache_signal(sender, instance, **kwargs):
+    """Make the next get_cached_settings() call read the saved settings"""
+    sender.clear_cached_settings()
+
+@receiver(post_save, sender=SystemSettings)
+def clear_system_settings_cache_signal(sender, instance, **kwargs):
+    """Make the next get_cached_settings() call read the saved settings"""
+    sender.clear_cached_settings()
+
 @receiver(post_save, sender=SessionCheckIn)
 def update_last_attendance_signal(sender, instance, created, **kwargs):
     """Update student's last attendance timestamp"""
@@ -0,0 +1,26 @@
+# core/parsers.py - Fast JSON parsing for API requests
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - parsing falls back to DRF's json decoder
+    orjson = None
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser that decodes with orjson when it is installed
+
+    orjson reads the UTF-8 body bytes directly, several times faster than
+    decoding them to str and running the stdlib parser.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,42 @@
+# core/renderers.py - Fast JSON rendering for API responses
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - rendering falls back to DRF's json encoder
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed
+
+    orjson encodes lists of plain dicts several times faster than the stdlib
+    encoder. Dates, times, Decimals and lazy strings are passed to DRF's own
+    encoder, so they come out exactly as JSONRenderer would write them.
+    Requests for indented output and payloads orjson still can't encode go
+    through the regular JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def dumps(data):
+    """Encode JSON-native data to bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
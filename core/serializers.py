@@ -23,6 +23,9 @@ from .models import (
 )
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, F, Prefetch, QuerySet, Value
+from django.db.models.functions import Concat
 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
@@ -32,18 +35,54 @@ from .models import TimetableEntry, TimeSlot, Room, Course, AdminUser
 # --------------------------
 # Academic Structure Serializers
 # --------------------------
-class DepartmentSerializer(serializers.ModelSerializer):
+class CachedRepresentationMixin:
+    """
+    Cache to_representation() output for slowly-changing reference data
+    
+    Entries are keyed by serializer, pk and updated_at, plus the updated_at of
+    every foreign key listed in representation_cache_related, so saving any row
+    the output is built from moves it to a fresh key and the old entry simply
+    expires. Many-to-many changes don't touch updated_at, so serializers that
+    render M2M data must not use this mixin.
+    """
+    representation_cache_timeout = 3600
+    representation_cache_related = ()
+    
+    def to_representation(self, instance):
+        versions = [instance.updated_at]
+        for name in self.representation_cache_related:
+            related = getattr(instance, name)
+            versions.append(related.updated_at if related is not None else None)
+        key = ':'.join(
+            [type(self).__name__, str(instance.pk)]
+            + [str(version.timestamp()) if version else '-' for version in versions]
+        )
+        data = cache.get(key)
+        if data is None:
+            data = super().to_representation(instance)
+            cache.set(key, data, self.representation_cache_timeout)
+        return data
+
+class DepartmentSerializer(CachedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Department
-        fields = '__all__'
+        fields = [
+            'id', 'department_name', 'department_code', 'description', 'head_of_department',
+            'contact_email', 'contact_phone', 'location', 'is_active', 'created_at', 'updated_at'
+        ]
         read_only_fields = ['created_at', 'updated_at']
 
-class SpecializationSerializer(serializers.ModelSerializer):
+class SpecializationSerializer(CachedRepresentationMixin, serializers.ModelSerializer):
     department_name = serializers.CharField(source='department.department_name', read_only=True)
+    # Renaming the department must invalidate the cached department_name
+    representation_cache_related = ('department',)
     
     class Meta:
         model = Specialization
-        fields = '__all__'
+        fields = [
+            'id', 'department_name', 'specialization_name', 'specialization_code', 'description',
+            'duration_years', 'is_active', 'created_at', 'updated_at', 'department'
+        ]
         read_only_fields = ['created_at', 'updated_at']
 
 class LevelSerializer(serializers.ModelSerializer):
@@ -52,8 +91,17 @@ class LevelSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Level
-        fields = '__all__'
+        fields = [
+            'id', 'department_names', 'specialization_names', 'level_name', 'level_code',
+            'level_order', 'description', 'is_active', 'created_at', 'updated_at',
+            'departments', 'specializations'
+        ]
         read_only_fields = ['created_at', 'updated_at']
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load the related rows rendered by this serializer in bulk"""
+        return queryset.prefetch_related('departments', 'specializations')
 
 class CourseSerializer(serializers.ModelSerializer):
     department_name = serializers.CharField(source='department.department_name', read_only=True)
@@ -64,11 +112,32 @@ class CourseSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Course
-        fields = '__all__'
+        fields = [
+            'id', 'department_name', 'level_name', 'specialization_names', 'teacher_names',
+            'enrolled_students_count', 'course_code', 'course_name', 'credits', 'description',
+            'semester', 'status', 'room', 'schedule', 'created_at', 'updated_at',
+            'department', 'level', 'specializations', 'teachers'
+        ]
         read_only_fields = ['created_at', 'updated_at']
     
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load the related rows rendered by this serializer in bulk"""
+        # Count in SQL instead of one COUNT(*) per course; distinct because
+        # teacher/specialization filters on the queryset join M2M tables
+        return queryset.select_related(
+            'department', 'level'
+        ).prefetch_related('specializations', 'teachers').annotate(
+            enrolled_students_count=Count('enrolled_students', distinct=True)
+        )
+    
     def get_enrolled_students_count(self, obj):
-        return obj.enrolled_students.count()
+        # Annotated by setup_eager_loading(); instances saved by create/update
+        # responses don't carry it
+        count = getattr(obj, 'enrolled_students_count', None)
+        if count is None:
+            count = obj.enrolled_students.count()
+        return count
 
 class CourseListSerializer(serializers.ModelSerializer):
     """Simplified serializer for course lists"""
@@ -78,6 +147,11 @@ class CourseListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = ['id', 'course_code', 'course_name', 'credits', 'department_name', 'level_name', 'status']
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load the related rows rendered by this serializer in bulk"""
+        return queryset.select_related('department', 'level')
 
 # --------------------------
 # Updated User and Student Serializers
@@ -108,18 +182,50 @@ class StudentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Student
-        fields = '__all__'
+        fields = [
+            'id', 'full_name', 'department_name', 'specialization_name', 'level_name',
+            'enrolled_courses', 'enrolled_courses_count', 'first_name', 'last_name',
+            'matric_number', 'email', 'phone', 'address', 'date_of_birth', 'gender',
+            'emergency_contact', 'emergency_phone', 'student_id', 'student_class', 'name',
+            'status', 'registration_date', 'graduation_date', 'academic_year', 'attendance_rate',
+            'face_encoding', 'face_encoding_model', 'face_images_count', 'last_attendance',
+            'registered_on', 'created_at', 'updated_at', 'department', 'specialization', 'level'
+        ]
         read_only_fields = ['created_at', 'updated_at', 'registered_on', 'attendance_rate', 'name', 'student_id']
         extra_kwargs = {
             'face_encoding': {'write_only': True}
         }
     
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load the related rows rendered by this serializer in bulk"""
+        # Nested CourseListSerializer reads department/level on every course
+        enrolled_courses = CourseListSerializer.setup_eager_loading(Course.objects.all())
+        # face_encoding is write-only, so the encrypted blob is never read back
+        return queryset.defer('face_encoding').select_related(
+            'department', 'specialization', 'level'
+        ).prefetch_related(
+            Prefetch('enrolled_courses', queryset=enrolled_courses)
+        ).annotate(
+            enrolled_courses_total=Count('enrolled_courses', distinct=True)
+        )
+    
     def get_enrolled_courses_count(self, obj):
-        return obj.enrolled_courses.count()
+        # Annotated by setup_eager_loading() under another name, since it can't
+        # shadow the Student.enrolled_courses_count property used otherwise
+        count = getattr(obj, 'enrolled_courses_total', None)
+        if count is None:
+            count = obj.enrolled_courses_count
+        return count
 
 class StudentListSerializer(serializers.ModelSerializer):
-    """Simplified serializer for student lists"""
-    full_name = serializers.ReadOnlyField()
+    """
+    Simplified serializer for student lists
+    
+    Querysets passed here should go through setup_eager_loading(), which also
+    defers the face_encoding column this serializer never renders.
+    """
+    full_name = serializers.SerializerMethodField()
     department_name = serializers.CharField(source='department.department_name', read_only=True)
     specialization_name = serializers.CharField(source='specialization.specialization_name', read_only=True)
     level_name = serializers.CharField(source='level.level_name', read_only=True)
@@ -128,6 +234,22 @@ class StudentListSerializer(serializers.ModelSerializer):
         model = Student
         fields = ['id', 'full_name', 'matric_number', 'email', 'department_name', 
                  'specialization_name', 'level_name', 'status', 'attendance_rate']
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load the related rows rendered by this serializer in bulk"""
+        return queryset.defer('face_encoding').select_related(
+            'department', 'specialization', 'level'
+        ).annotate(
+            full_name_db=Concat('first_name', Value(' '), 'last_name')
+        )
+    
+    def get_full_name(self, obj):
+        # Concatenated in SQL by setup_eager_loading(); Student.full_name is a property
+        full_name = getattr(obj, 'full_name_db', None)
+        if full_name is None:
+            full_name = obj.full_name
+        return full_name
 
 class StudentCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating students"""
@@ -167,9 +289,45 @@ class AttendanceRecordSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AttendanceRecord
-        fields = '__all__'
+        fields = [
+            'id', 'student_name', 'student_matric', 'course_name', 'course_code', 'date',
+            'status', 'check_in_time', 'check_out_time', 'attendance_date',
+            'recognition_confidence', 'recognition_model', 'location', 'device_info', 'notes',
+            'timestamp', 'created_at', 'updated_at', 'student', 'course'
+        ]
         read_only_fields = ['created_at', 'updated_at', 'timestamp']
 
+class AttendanceRecordListSerializer(serializers.ListSerializer):
+    """Render attendance querysets from a single values() query instead of per-field dispatch"""
+    
+    def to_representation(self, data):
+        if not isinstance(data, QuerySet):
+            return super().to_representation(data)
+        
+        fields = self.child.fields
+        rows = data.values(
+            'id', 'status', 'check_in_time', 'check_out_time', 'attendance_date',
+            student_name=Concat('student__first_name', Value(' '), 'student__last_name'),
+            student_matric=F('student__matric_number'),
+            course_code=F('course__course_code'),
+        )
+        return [
+            {
+                'id': row['id'],
+                'student_name': row['student_name'],
+                'student_matric': row['student_matric'],
+                'course_code': row['course_code'],
+                'status': row['status'],
+                'check_in_time': fields['check_in_time'].to_representation(row['check_in_time']),
+                'check_out_time': (
+                    fields['check_out_time'].to_representation(row['check_out_time'])
+                    if row['check_out_time'] is not None else None
+                ),
+                'date': row['attendance_date'] or row['check_in_time'].date(),
+            }
+            for row in rows
+        ]
+
 class AttendanceListSerializer(serializers.ModelSerializer):
     """Simplified serializer for attendance lists"""
     student_name = serializers.CharField(source='student.full_name', read_only=True)
@@ -180,6 +338,7 @@ class AttendanceListSerializer(serializers.ModelSerializer):
         model = AttendanceRecord
         fields = ['id', 'student_name', 'student_matric', 'course_code', 'status', 
                  'check_in_time', 'check_out_time', 'date']
+        list_serializer_class = AttendanceRecordListSerializer
 
 class AttendanceCreateSerializer(serializers.ModelSerializer):
     """Enhanced serializer for creating attendance records with auto-enrollment"""
@@ -298,42 +457,75 @@ class UserActivitySerializer(serializers.ModelSerializer):
     
     class Meta:
         model = UserActivity
-        fields = '__all__'
+        fields = [
+            'id', 'user_name', 'action', 'resource', 'resource_id', 'details', 'ip_address',
+            'user_agent', 'session_id', 'status', 'timestamp', 'user'
+        ]
 
 class LoginAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = LoginAttempt
-        fields = '__all__'
+        fields = [
+            'id', 'username', 'ip_address', 'user_agent', 'location', 'success',
+            'failure_reason', 'timestamp'
+        ]
 
 class ActiveSessionSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = ActiveSession
-        fields = '__all__'
+        fields = [
+            'id', 'user_name', 'session_key', 'ip_address', 'user_agent', 'location',
+            'last_activity', 'created_at', 'is_active', 'user'
+        ]
 
 class SecuritySettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = SecuritySettings
-        fields = '__all__'
+        fields = [
+            'id', 'min_password_length', 'require_uppercase', 'require_lowercase',
+            'require_numbers', 'require_special_chars', 'password_expiry_days',
+            'session_timeout_minutes', 'max_concurrent_sessions', 'max_failed_attempts',
+            'lockout_duration_minutes', 'enable_2fa', 'force_2fa_for_admins',
+            'enable_ip_whitelist', 'allowed_ip_ranges', 'log_all_activities',
+            'log_retention_days', 'created_at', 'updated_at', 'updated_by'
+        ]
         read_only_fields = ['created_at', 'updated_at', 'updated_by']
 
+# Every SystemSettings field except created_at, updated_at and updated_by
+SYSTEM_SETTINGS_FIELDS = [
+    'id', 'institution_name', 'institution_code', 'address', 'contact_email', 'contact_phone',
+    'academic_year', 'school_name', 'school_address', 'school_phone', 'school_email',
+    'timezone', 'date_format', 'time_format', 'attendance_grace_period', 'late_threshold',
+    'auto_mark_absent_after', 'require_checkout', 'allow_manual_attendance',
+    'attendance_notifications', 'face_recognition_enabled', 'face_confidence_threshold',
+    'max_face_images_per_student', 'face_detection_timeout', 'auto_capture_enabled',
+    'face_image_quality_threshold', 'email_enabled', 'smtp_host', 'smtp_port', 'smtp_username',
+    'smtp_password', 'smtp_use_tls', 'email_from_address', 'email_from_name',
+    'send_absence_notifications', 'send_late_notifications', 'send_weekly_reports',
+    'parent_notification_enabled', 'admin_notification_enabled', 'max_file_upload_size',
+    'image_compression_quality', 'auto_backup_enabled', 'backup_frequency',
+    'backup_retention_days', 'storage_cleanup_enabled', 'maintenance_mode',
+    'maintenance_message', 'system_announcement', 'debug_mode', 'log_level'
+]
+
 class SystemSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = SystemSettings
-        exclude = ['created_at', 'updated_at', 'updated_by']
+        fields = SYSTEM_SETTINGS_FIELDS
     
-    def validate_smtp_password(self, value):
+    def to_representation(self, instance):
         """Don't return the actual password for security"""
-        if value:
-            return '***HIDDEN***'
-        return value
+        ret = super().to_representation(instance)
+        ret['smtp_password'] = '***HIDDEN***' if instance.smtp_password else ''
+        return ret
 
 class SystemSettingsUpdateSerializer(serializers.ModelSerializer):
     """Separate serializer for updates to handle password properly"""
     class Meta:
         model = SystemSettings
-        exclude = ['created_at', 'updated_at', 'updated_by']
+        fields = SYSTEM_SETTINGS_FIELDS
     
     def update(self, instance, validated_data):
         # Handle password field specially
@@ -410,15 +602,22 @@ class StudentEnrollmentSerializer(serializers.Serializer):
     )
     
     def validate_student_id(self, value):
-        if not Student.objects.filter(id=value).exists():
+        # Fetch once and stash the instance so the view doesn't query it again
+        student = Student.objects.filter(id=value).only('id', 'first_name', 'last_name').first()
+        if student is None:
             raise serializers.ValidationError("Student not found.")
+        self.context['student'] = student
         return value
     
     def validate_course_ids(self, value):
-        existing_courses = Course.objects.filter(id__in=value, status='active')
-        if len(existing_courses) != len(value):
+        # Only fetch IDs; the validated (deduplicated) IDs are what the view enrolls,
+        # so it doesn't need to query the courses again
+        existing_ids = set(
+            Course.objects.filter(id__in=value, status='active').values_list('id', flat=True)
+        )
+        if len(existing_ids) != len(set(value)):
             raise serializers.ValidationError("One or more courses not found or inactive.")
-        return value
+        return list(existing_ids)
 
 class BulkEnrollmentSerializer(serializers.Serializer):
     """For bulk enrollment operations"""
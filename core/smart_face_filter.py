@@ -1,11 +1,76 @@
 # core/smart_face_filter.py - Smart filtering to reduce false positives
 
 import cv2
+import hashlib
 import numpy as np
 import logging
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass
+
+try:
+    from ._nms_numba import iou_xyxy, nms_numba
+except ImportError:  # numba is optional - overlap filtering falls back to NumPy
+    iou_xyxy = nms_numba = None
 
 logger = logging.getLogger(__name__)
 
+# Candidate count from which overlap filtering buckets faces into a spatial grid
+# instead of testing every pair (only used without numba)
+SPATIAL_HASH_MIN_FACES = 20
+
+# Number of memoized region quality scores kept per SmartFaceFilter
+QUALITY_CACHE_SIZE = 128
+
+# Sobel L1 magnitude above which a pixel counts as an edge for region quality.
+# This is Canny(50, 150)'s strong-edge threshold on the same magnitude: face and
+# background crops then get about the edge density Canny gave them, which the
+# edge score's scale was tuned for, while sensor noise on flat regions (which a
+# lower threshold counts as dense edges) stays below it.
+EDGE_MAGNITUDE_THRESHOLD = 150
+
+# Image dimensions read once per filter_faces() call and shared by every stage
+ImageDims = namedtuple('ImageDims', ['width', 'height', 'min_dim', 'area'])
+
+@dataclass
+class FaceBatch:
+    """
+    Structure-of-arrays view of a list of face detections
+    
+    Filter stages read and update the bbox/confidence arrays and the parallel
+    per-face fields instead of the detection dicts; write_back() copies the
+    results onto the original dicts once filtering is done.
+    """
+    faces: list
+    bboxes: np.ndarray          # (N, 4) x1, y1, x2, y2 in the detections' dtype
+    confidence: np.ndarray      # (N,) float64
+    rescored: np.ndarray        # (N,) bool, confidence changed by a filter
+    edge_detection: np.ndarray  # (N,) bool, face sits on the image border
+    region_quality: list        # per-face quality score, None until scored
+    
+    @classmethod
+    def from_detections(cls, faces):
+        face_count = len(faces)
+        return cls(
+            faces=faces,
+            bboxes=np.asarray([face['bbox'] for face in faces]).reshape(face_count, 4),
+            confidence=np.fromiter(
+                (face['confidence'] for face in faces), dtype=np.float64, count=face_count
+            ),
+            rescored=np.zeros(face_count, dtype=bool),
+            edge_detection=np.zeros(face_count, dtype=bool),
+            region_quality=[None] * face_count
+        )
+        
+    def write_back(self):
+        """Copy updated confidences and flags onto the detection dicts"""
+        for i in np.flatnonzero(self.rescored):
+            self.faces[i]['confidence'] = float(self.confidence[i])
+        for i in np.flatnonzero(self.edge_detection):
+            self.faces[i]['edge_detection'] = True
+        for face, quality in zip(self.faces, self.region_quality):
+            if quality is not None:
+                face['region_quality'] = quality
+
 class SmartFaceFilter:
     """
     Intelligent face filtering to reduce false positives from OpenCV
@@ -18,9 +83,16 @@ class SmartFaceFilter:
             'position_filter': True,
             'quality_filter': True,
             'overlap_filter': True,
-            'confidence_ranking': True
+            'confidence_ranking': True,
+            # Regions smaller than this (in pixels) are too noisy to score
+            'quality_min_area': 60 * 60
         }
         
+        # Region quality scores keyed by bbox and a digest of the region's pixels,
+        # least recently used first. The key depends only on content, so an
+        # unchanged region in a later frame (or a reused frame buffer) is safe.
+        self._quality_cache = OrderedDict()
+        
     def filter_faces(self, faces, image, return_debug_info=False):
         """
         Apply intelligent filtering to remove false positives
@@ -36,236 +108,415 @@ class SmartFaceFilter:
         if not faces:
             return faces
             
+        # One person at the camera is the common case; it can't overlap anything
+        # or be out-ranked, so only the per-face checks are needed
+        height, width = image.shape[:2]
+        dims = ImageDims(width, height, min(width, height), width * height)
+        
+        if len(faces) == 1 and not return_debug_info:
+            return self._fast_single_face_path(faces, image, dims)
+            
+        # Debug info (removed-face entries and stage messages) is only built when
+        # the caller asks for it; every stage skips that work when it is None
         debug_info = {
             'original_count': len(faces),
             'filters_applied': [],
             'removed_faces': []
-        }
+        } if return_debug_info else None
         
-        filtered_faces = faces.copy()
+        # Stages work on column arrays rather than the detection dicts, and every
+        # stage narrows one keep-mask over the original list; the surviving faces
+        # are only materialized once, after the last filter
+        batch = FaceBatch.from_detections(faces)
+        keep = np.ones(len(faces), dtype=bool)
         
-        # Filter 1: Size filtering (remove tiny and huge detections)
-        if self.filters['size_filter']:
-            filtered_faces, removed = self._filter_by_size(filtered_faces, image)
-            debug_info['filters_applied'].append(f"Size filter: removed {len(removed)}")
-            debug_info['removed_faces'].extend(removed)
-            
-        # Filter 2: Aspect ratio filtering (faces should be roughly square/oval)
-        if self.filters['aspect_ratio_filter']:
-            filtered_faces, removed = self._filter_by_aspect_ratio(filtered_faces)
-            debug_info['filters_applied'].append(f"Aspect ratio filter: removed {len(removed)}")
-            debug_info['removed_faces'].extend(removed)
-            
-        # Filter 3: Position filtering (remove edge artifacts)
-        if self.filters['position_filter']:
-            filtered_faces, removed = self._filter_by_position(filtered_faces, image)
-            debug_info['filters_applied'].append(f"Position filter: removed {len(removed)}")
-            debug_info['removed_faces'].extend(removed)
+        # Filters 1-3: Size, aspect ratio and position checks in one vectorized pass
+        if (self.filters['size_filter'] or self.filters['aspect_ratio_filter'] or
+                self.filters['position_filter']):
+            self._apply_geometric_filters(batch, keep, dims, debug_info)
             
         # Filter 4: Image quality in face region
         if self.filters['quality_filter']:
-            filtered_faces, removed = self._filter_by_face_quality(filtered_faces, image)
-            debug_info['filters_applied'].append(f"Quality filter: removed {len(removed)}")
-            debug_info['removed_faces'].extend(removed)
+            self._filter_by_face_quality(batch, keep, image, debug_info)
+            
+        batch.write_back()
+            
+        # Confidences are final from here on, so one best-first ordering of the
+        # survivors (stable, so ties keep detection order) serves both the overlap
+        # filter and the ranking
+        order = None
+        if self.filters['overlap_filter'] or self.filters['confidence_ranking']:
+            candidates = np.flatnonzero(keep)
+            order = candidates[np.argsort(-batch.confidence[candidates], kind='stable')]
             
         # Filter 5: Remove overlapping detections (keep best one)
         if self.filters['overlap_filter']:
-            filtered_faces, removed = self._filter_overlapping_faces(filtered_faces)
-            debug_info['filters_applied'].append(f"Overlap filter: removed {len(removed)}")
-            debug_info['removed_faces'].extend(removed)
+            self._filter_overlapping_faces(batch, keep, order, debug_info)
+            order = order[keep[order]]
             
         # Filter 6: Rank by confidence and keep top N
         if self.filters['confidence_ranking']:
-            filtered_faces = self._rank_and_limit_faces(filtered_faces, max_faces=3)
-            debug_info['filters_applied'].append(f"Confidence ranking: kept top {len(filtered_faces)}")
+            filtered_faces = self._rank_and_limit_faces(faces, order, max_faces=3)
+            if debug_info is not None:
+                debug_info['filters_applied'].append(f"Confidence ranking: kept top {len(filtered_faces)}")
+        elif order is not None:
+            # The overlap filter hands back its survivors best-first
+            filtered_faces = [faces[i] for i in order]
+        else:
+            filtered_faces = [faces[i] for i in np.flatnonzero(keep)]
             
-        debug_info['final_count'] = len(filtered_faces)
-        
-        logger.info(f"Face filtering: {debug_info['original_count']} → {debug_info['final_count']} faces")
+        logger.info(f"Face filtering: {len(faces)} → {len(filtered_faces)} faces")
         
         if return_debug_info:
+            debug_info['final_count'] = len(filtered_faces)
             return filtered_faces, debug_info
         return filtered_faces
         
-    def _filter_by_size(self, faces, image):
-        """Remove faces that are too small or too large"""
-        height, width = image.shape[:2]
-        image_area = height * width
+    def _fast_single_face_path(self, faces, image, dims):
+        """
+        Filter a single detection with scalar checks
         
-        filtered_faces = []
-        removed_faces = []
+        Gives the same result as the full pipeline for one face, but skips the
+        array setup, NMS and ranking stages that are no-ops for a single face.
+        """
+        face = faces[0]
+        x1, y1, x2, y2 = face['bbox']
+        face_width = x2 - x1
+        face_height = y2 - y1
+        filtered_faces = [face]
         
-        for face in faces:
-            x1, y1, x2, y2 = face['bbox']
-            face_width = x2 - x1
-            face_height = y2 - y1
-            face_area = face_width * face_height
-            
-            # Size limits based on image resolution
-            min_size = min(30, min(width, height) * 0.02)  # At least 2% of smallest dimension
-            max_size = min(width, height) * 0.8            # At most 80% of smallest dimension
-            
-            # Area limits (face shouldn't be more than 25% of image)
-            max_area_ratio = 0.25
-            
+        if self.filters['size_filter']:
+            min_size = min(30, dims.min_dim * 0.02)
+            max_size = dims.min_dim * 0.8
             if (face_width < min_size or face_height < min_size or
                 face_width > max_size or face_height > max_size or
-                face_area > image_area * max_area_ratio):
+                face_width * face_height > dims.area * 0.25):
+                filtered_faces = []
                 
-                removed_faces.append({
-                    'face': face,
-                    'reason': f'Size: {face_width}x{face_height}, limits: {min_size}-{max_size}'
-                })
-            else:
-                filtered_faces.append(face)
+        if filtered_faces and self.filters['aspect_ratio_filter']:
+            aspect_ratio = face_width / face_height if face_height > 0 else 0
+            if not 0.6 <= aspect_ratio <= 1.4:
+                filtered_faces = []
                 
-        return filtered_faces, removed_faces
-        
-    def _filter_by_aspect_ratio(self, faces):
-        """Remove detections with non-face-like aspect ratios"""
-        filtered_faces = []
-        removed_faces = []
-        
-        for face in faces:
-            x1, y1, x2, y2 = face['bbox']
-            width = x2 - x1
-            height = y2 - y1
-            aspect_ratio = width / height if height > 0 else 0
-            
-            # Faces should be roughly between 0.6 and 1.4 aspect ratio
-            # (slightly taller than wide to square to slightly wider than tall)
-            if 0.6 <= aspect_ratio <= 1.4:
-                filtered_faces.append(face)
-            else:
-                removed_faces.append({
-                    'face': face,
-                    'reason': f'Aspect ratio: {aspect_ratio:.2f} (should be 0.6-1.4)'
-                })
+        if filtered_faces and self.filters['position_filter']:
+            edge_margin = min(20, dims.min_dim * 0.05)
+            if (x1 < edge_margin or y1 < edge_margin or
+                x2 > dims.width - edge_margin or y2 > dims.height - edge_margin):
+                face['confidence'] *= 0.3
+                face['edge_detection'] = True
                 
-        return filtered_faces, removed_faces
+        if filtered_faces and self.filters['quality_filter']:
+            batch = FaceBatch.from_detections(faces)
+            keep = np.ones(1, dtype=bool)
+            self._filter_by_face_quality(batch, keep, image, None)
+            batch.write_back()
+            if not keep[0]:
+                filtered_faces = []
+                
+        logger.info(f"Face filtering: 1 → {len(filtered_faces)} faces")
+        return filtered_faces
         
-    def _filter_by_position(self, faces, image):
-        """Remove faces too close to image edges (likely artifacts)"""
-        height, width = image.shape[:2]
-        edge_margin = min(20, min(width, height) * 0.05)  # 5% margin from edges
+    def _apply_geometric_filters(self, batch, keep, dims, debug_info):
+        """
+        Apply the size, aspect ratio and position filters with NumPy masks
         
-        filtered_faces = []
-        removed_faces = []
+        Widths, heights and areas are computed once for all faces. Each enabled
+        filter clears entries of keep in place and only sees the faces that
+        survived the previous ones, as if they ran one after another, reporting
+        into debug_info (when not None) the same way.
+        """
+        faces = batch.faces
+        x1, y1, x2, y2 = batch.bboxes.T
+        face_width = x2 - x1
+        face_height = y2 - y1
         
-        for face in faces:
-            x1, y1, x2, y2 = face['bbox']
+        # Filter 1: Size filtering (remove tiny and huge detections)
+        if self.filters['size_filter']:
+            # Size limits based on image resolution
+            min_size = min(30, dims.min_dim * 0.02)  # At least 2% of smallest dimension
+            max_size = dims.min_dim * 0.8            # At most 80% of smallest dimension
+            
+            # Area limits (face shouldn't be more than 25% of image)
+            max_area_ratio = 0.25
+            
+            size_ok = (
+                (face_width >= min_size) & (face_height >= min_size) &
+                (face_width <= max_size) & (face_height <= max_size) &
+                (face_width * face_height <= dims.area * max_area_ratio)
+            )
+            if debug_info is not None:
+                removed = [
+                    {
+                        'face': faces[i],
+                        'reason': f'Size: {faces[i]["bbox"][2] - faces[i]["bbox"][0]}x'
+                                  f'{faces[i]["bbox"][3] - faces[i]["bbox"][1]}, limits: {min_size}-{max_size}'
+                    }
+                    for i in np.flatnonzero(keep & ~size_ok)
+                ]
+                debug_info['filters_applied'].append(f"Size filter: removed {len(removed)}")
+                debug_info['removed_faces'].extend(removed)
+            keep &= size_ok
+            
+        # Filter 2: Aspect ratio filtering (faces should be roughly square/oval)
+        if self.filters['aspect_ratio_filter']:
+            aspect_ratio = np.divide(
+                face_width, face_height, out=np.zeros(len(faces)), where=face_height > 0
+            )
+            
+            # Faces should be roughly between 0.6 and 1.4 aspect ratio
+            # (slightly taller than wide to square to slightly wider than tall)
+            aspect_ok = (aspect_ratio >= 0.6) & (aspect_ratio <= 1.4)
+            if debug_info is not None:
+                removed = [
+                    {
+                        'face': faces[i],
+                        'reason': f'Aspect ratio: {aspect_ratio[i]:.2f} (should be 0.6-1.4)'
+                    }
+                    for i in np.flatnonzero(keep & ~aspect_ok)
+                ]
+                debug_info['filters_applied'].append(f"Aspect ratio filter: removed {len(removed)}")
+                debug_info['removed_faces'].extend(removed)
+            keep &= aspect_ok
+            
+        # Filter 3: Position filtering (remove edge artifacts)
+        if self.filters['position_filter']:
+            edge_margin = min(20, dims.min_dim * 0.05)  # 5% margin from edges
             
             # Check if face is too close to any edge
-            too_close_to_edge = (
-                x1 < edge_margin or y1 < edge_margin or
-                x2 > width - edge_margin or y2 > height - edge_margin
+            too_close_to_edge = keep & (
+                (x1 < edge_margin) | (y1 < edge_margin) |
+                (x2 > dims.width - edge_margin) | (y2 > dims.height - edge_margin)
             )
             
-            if too_close_to_edge:
-                # Don't remove completely, but reduce confidence significantly
-                face['confidence'] *= 0.3
-                face['edge_detection'] = True
-                
-            filtered_faces.append(face)
-                
-        return filtered_faces, removed_faces
+            # Don't remove completely, but reduce confidence significantly
+            batch.confidence[too_close_to_edge] *= 0.3
+            batch.rescored |= too_close_to_edge
+            batch.edge_detection |= too_close_to_edge
+            
+            if debug_info is not None:
+                debug_info['filters_applied'].append("Position filter: removed 0")
+        
+    def _build_quality_tables(self, gray):
+        """
+        Precompute summed-area tables for region quality analysis
+        
+        Runs the edge operator once over the full grayscale frame, then integrates
+        pixel values, squared values and edge hits so each face region's
+        statistics become constant-time table lookups.
+        """
+        sums, squared_sums = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        
+        # A thresholded Sobel gradient magnitude (L1) is enough to measure edge
+        # density; Canny's blur/NMS/hysteresis stages only matter for tracing
+        # edges. cv2.add saturates instead of wrapping the uint8 sum.
+        grad_x = cv2.Sobel(gray, cv2.CV_16S, 1, 0)
+        grad_y = cv2.Sobel(gray, cv2.CV_16S, 0, 1)
+        magnitude = cv2.add(cv2.convertScaleAbs(grad_x), cv2.convertScaleAbs(grad_y))
+        edge_sums = cv2.integral((magnitude > EDGE_MAGNITUDE_THRESHOLD).astype(np.uint8))
         
-    def _filter_by_face_quality(self, faces, image):
+        return sums, squared_sums, edge_sums
+        
+    def _filter_by_face_quality(self, batch, keep, image, debug_info):
         """Analyze the actual face region for face-like features"""
-        filtered_faces = []
-        removed_faces = []
+        removed_faces = [] if debug_info is not None else None
         
-        for face in faces:
-            x1, y1, x2, y2 = face['bbox']
-            
-            # Extract face region
-            face_region = image[y1:y2, x1:x2]
-            
-            if face_region.size == 0:
-                removed_faces.append({
-                    'face': face,
-                    'reason': 'Empty face region'
-                })
+        # The grayscale frame and its summed-area tables are built at most once
+        # per image, and only if some face actually needs analysis
+        quality_tables = None
+        height, width = image.shape[:2]
+        
+        for i in np.flatnonzero(keep):
+            # Statistics on tiny regions are noise-dominated; give them a neutral
+            # score instead of analyzing them (degenerate boxes still fall through
+            # to the empty-region check)
+            bbox = batch.bboxes[i]
+            x1, y1, x2, y2 = bbox
+            if x2 > x1 and y2 > y1 and (x2 - x1) * (y2 - y1) < self.filters['quality_min_area']:
+                batch.region_quality[i] = 50
+                # Scale like an analyzed face with that score, so skipping the
+                # analysis doesn't let a small face outrank scored ones
+                batch.confidence[i] *= 0.5
+                batch.rescored[i] = True
                 continue
                 
-            # Convert to grayscale for analysis
-            if len(face_region.shape) == 3:
-                gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
+            # Hashing the region is far cheaper than building the frame-wide
+            # tables, which are skipped when every region is a cache hit
+            cx1, cx2 = min(max(int(x1), 0), width), min(max(int(x2), 0), width)
+            cy1, cy2 = min(max(int(y1), 0), height), min(max(int(y2), 0), height)
+            region = np.ascontiguousarray(image[cy1:cy2, cx1:cx2])
+            cache_key = (cx1, cy1, cx2, cy2, hashlib.blake2b(region, digest_size=16).digest())
+            if cache_key in self._quality_cache:
+                self._quality_cache.move_to_end(cache_key)
+                quality_score = self._quality_cache[cache_key]
             else:
-                gray_face = face_region
-                
-            # Check for face-like characteristics
-            quality_score = self._analyze_face_region_quality(gray_face)
+                if quality_tables is None:
+                    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+                    quality_tables = self._build_quality_tables(gray)
+                    
+                # Check for face-like characteristics
+                quality_score = self._analyze_face_region_quality(bbox, quality_tables)
+                self._quality_cache[cache_key] = quality_score
+                if len(self._quality_cache) > QUALITY_CACHE_SIZE:
+                    self._quality_cache.popitem(last=False)
+            
+            if quality_score is None:
+                keep[i] = False
+                if removed_faces is not None:
+                    removed_faces.append({
+                        'face': batch.faces[i],
+                        'reason': 'Empty face region'
+                    })
+                continue
             
             # Update confidence based on quality
-            face['region_quality'] = quality_score
-            face['confidence'] *= (quality_score / 100)  # Scale confidence by quality
+            batch.region_quality[i] = quality_score
+            batch.confidence[i] *= (quality_score / 100)  # Scale confidence by quality
+            batch.rescored[i] = True
             
             # Keep faces with reasonable quality
-            if quality_score > 20:  # Very low threshold, just remove obvious non-faces
-                filtered_faces.append(face)
-            else:
-                removed_faces.append({
-                    'face': face,
-                    'reason': f'Poor region quality: {quality_score:.1f}'
-                })
+            if quality_score <= 20:  # Very low threshold, just remove obvious non-faces
+                keep[i] = False
+                if removed_faces is not None:
+                    removed_faces.append({
+                        'face': batch.faces[i],
+                        'reason': f'Poor region quality: {quality_score:.1f}'
+                    })
                 
-        return filtered_faces, removed_faces
-        
-    def _analyze_face_region_quality(self, gray_face):
-        """Analyze if a region looks like it could contain a face"""
-        try:
-            # Check for reasonable contrast (faces have eyes, mouth, etc.)
-            contrast = np.std(gray_face)
-            contrast_score = min(100, contrast * 2)  # Higher contrast = more likely to be face
-            
-            # Check for edge density (faces have more edges than flat regions)
-            edges = cv2.Canny(gray_face, 50, 150)
-            edge_density = np.sum(edges > 0) / edges.size
-            edge_score = min(100, edge_density * 1000)  # More edges = more likely to be face
+        if debug_info is not None:
+            debug_info['filters_applied'].append(f"Quality filter: removed {len(removed_faces)}")
+            debug_info['removed_faces'].extend(removed_faces)
+        
+    def _analyze_face_region_quality(self, bbox, quality_tables):
+        """
+        Analyze if a region looks like it could contain a face
+        
+        Region statistics are read from the tables built by _build_quality_tables().
+        Returns None for an empty region.
+        """
+        sums, squared_sums, edge_sums = quality_tables
+        height, width = sums.shape[0] - 1, sums.shape[1] - 1
+        
+        # Clamp the box to the frame; after this every lookup is in bounds, so
+        # no exception handling is needed
+        x1, y1, x2, y2 = (int(v) for v in bbox)
+        x1, x2 = min(max(x1, 0), width), min(max(x2, 0), width)
+        y1, y2 = min(max(y1, 0), height), min(max(y2, 0), height)
+        
+        if x2 <= x1 or y2 <= y1:
+            return None
+        pixel_count = (x2 - x1) * (y2 - y1)
+        
+        def region_sum(table):
+            return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+        
+        mean_brightness = region_sum(sums) / pixel_count
+        variance = region_sum(squared_sums) / pixel_count - mean_brightness ** 2
+        contrast = np.sqrt(max(variance, 0))
+        
+        # Check for reasonable contrast (faces have eyes, mouth, etc.)
+        contrast_score = min(100, contrast * 2)  # Higher contrast = more likely to be face
+        
+        # Check for edge density (faces have more edges than flat regions)
+        edge_density = region_sum(edge_sums) / pixel_count
+        edge_score = min(100, edge_density * 1000)  # More edges = more likely to be face
+        
+        # Check brightness distribution (faces aren't pure black/white)
+        brightness_score = 100 - abs(mean_brightness - 127)  # Closer to middle gray = better
+        
+        # Combine scores
+        quality_score = (contrast_score * 0.4 + edge_score * 0.4 + brightness_score * 0.2)
+        
+        return max(0, min(100, quality_score))
             
-            # Check brightness distribution (faces aren't pure black/white)
-            mean_brightness = np.mean(gray_face)
-            brightness_score = 100 - abs(mean_brightness - 127)  # Closer to middle gray = better
+    def _filter_overlapping_faces(self, batch, keep, order, debug_info):
+        """
+        Remove overlapping face detections, keep the best one
+        
+        order holds the indices of the current survivors, best-first.
+        """
+        candidates = order
+        if len(candidates) <= 1:
+            if debug_info is not None:
+                debug_info['filters_applied'].append("Overlap filter: removed 0")
+            return
             
-            # Combine scores
-            quality_score = (contrast_score * 0.4 + edge_score * 0.4 + brightness_score * 0.2)
+        boxes = batch.bboxes[candidates].astype(np.float64)
+        
+        # Candidates are already ranked, so position is the visiting order
+        ranked = np.arange(len(candidates))
+        survives = np.zeros(len(candidates), dtype=bool)
+        
+        if nms_numba is not None:
+            # Strictly decreasing scores make the kernel keep this order
+            survives[nms_numba(boxes, -ranked.astype(np.float64), 0.3)] = True
+        elif len(candidates) >= SPATIAL_HASH_MIN_FACES:
+            self._suppress_overlaps_grid(boxes, ranked, survives)
+        else:
+            self._suppress_overlaps(boxes, ranked, survives)
             
-            return max(0, min(100, quality_score))
+        keep[candidates[~survives]] = False
+        
+        if debug_info is not None:
+            removed = [
+                {'face': batch.faces[candidates[i]], 'reason': 'Overlaps with higher confidence face'}
+                for i in ranked if not survives[i]
+            ]
+            debug_info['filters_applied'].append(f"Overlap filter: removed {len(removed)}")
+            debug_info['removed_faces'].extend(removed)
+        
+    def _suppress_overlaps(self, boxes, ranked, keep):
+        """NumPy NMS fallback: mark in keep the faces that survive suppression"""
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        
+        # Greedy NMS: each accepted face suppresses every lower-ranked face it
+        # overlaps by more than 0.3 IoU, computed against all of them at once
+        order = ranked
+        while order.size:
+            i = order[0]
+            keep[i] = True
+            rest = order[1:]
             
-        except:
-            return 50  # Default score if analysis fails
+            inter_w = np.maximum(0, np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]))
+            inter_h = np.maximum(0, np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]))
+            intersection = inter_w * inter_h
+            union = areas[i] + areas[rest] - intersection
+            iou = np.divide(intersection, union, out=np.zeros(rest.size), where=union > 0)
             
-    def _filter_overlapping_faces(self, faces):
-        """Remove overlapping face detections, keep the best one"""
-        if len(faces) <= 1:
-            return faces, []
+            order = rest[iou <= 0.3]
             
-        filtered_faces = []
-        removed_faces = []
-        
-        # Sort by confidence (highest first)
-        sorted_faces = sorted(faces, key=lambda f: f['confidence'], reverse=True)
-        
-        for face in sorted_faces:
-            # Check if this face overlaps significantly with any already accepted face
-            overlaps = False
-            for accepted_face in filtered_faces:
-                if self._calculate_overlap(face['bbox'], accepted_face['bbox']) > 0.3:
-                    overlaps = True
-                    removed_faces.append({
-                        'face': face,
-                        'reason': 'Overlaps with higher confidence face'
-                    })
-                    break
-                    
+    def _suppress_overlaps_grid(self, boxes, ranked, keep):
+        """
+        Spatial-hash NMS for crowded scenes: mark in keep the faces that survive
+        
+        Accepted faces are bucketed by center into square cells as wide as the
+        largest box side. Two boxes can only intersect if their centers are less
+        than that apart, so each face only needs testing against accepted faces
+        in its own and the eight neighboring cells.
+        """
+        extents = np.concatenate([boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+        cell_size = max(extents.max(), 1.0)
+        centers_x = (boxes[:, 0] + boxes[:, 2]) * 0.5 // cell_size
+        centers_y = (boxes[:, 1] + boxes[:, 3]) * 0.5 // cell_size
+        bbox_tuples = [tuple(bbox) for bbox in boxes.tolist()]
+        
+        grid = {}
+        for i in ranked:
+            cell_x, cell_y = int(centers_x[i]), int(centers_y[i])
+            overlaps = any(
+                self._calculate_overlap(bbox_tuples[i], bbox_tuples[j]) > 0.3
+                for dx in (-1, 0, 1)
+                for dy in (-1, 0, 1)
+                for j in grid.get((cell_x + dx, cell_y + dy), ())
+            )
             if not overlaps:
-                filtered_faces.append(face)
+                keep[i] = True
+                grid.setdefault((cell_x, cell_y), []).append(i)
                 
-        return filtered_faces, removed_faces
-        
     def _calculate_overlap(self, bbox1, bbox2):
         """Calculate overlap ratio between two bounding boxes"""
+        if iou_xyxy is not None:
+            return iou_xyxy(*bbox1, *bbox2)
+            
         x1_1, y1_1, x2_1, y2_1 = bbox1
         x1_2, y1_2, x2_2, y2_2 = bbox2
         
@@ -287,8 +538,6 @@ class SmartFaceFilter:
         
         return intersection / union if union > 0 else 0
         
-    def _rank_and_limit_faces(self, faces, max_faces=2):
-        """Keep only the top N most confident faces"""
-        # Sort by confidence and keep top N
-        sorted_faces = sorted(faces, key=lambda f: f['confidence'], reverse=True)
-        return sorted_faces[:max_faces]
\ No newline at end of file
+    def _rank_and_limit_faces(self, faces, order, max_faces=2):
+        """Keep only the top N most confident faces (order is best-first)"""
+        return [faces[i] for i in order[:max_faces]]
\ No newline at end of file
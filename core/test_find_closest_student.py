@@ -0,0 +1,97 @@
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from . import face_utils
+from .models import Department, Level, Student
+
+
+class FindClosestStudentTests(TestCase):
+    """
+    Every matching path must agree with a brute-force L2 search, for students
+    stored in the current float32 format and in the legacy float64 one
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(department_name='Computer Science', department_code='CSC')
+        level = Level.objects.create(level_name='100', level_code='L100')
+        rng = np.random.default_rng(0)
+        cls.stored = {}
+        for matric_number, dtype in (('CSC/064', np.float64), ('CSC/032', np.float32)):
+            encoding = rng.normal(0, 0.1, 128).astype(dtype)
+            student = Student.objects.create(
+                first_name='Student', last_name=matric_number[-3:], matric_number=matric_number,
+                email=f'{matric_number[-3:]}@example.com', department=department, level=level,
+                face_encoding=encoding.tobytes()
+            )
+            cls.stored[student.id] = encoding
+
+        # Faces close to each student, between both (nearer one of them), and
+        # far from either
+        first, second = cls.stored.values()
+        cls.queries = [encoding + rng.normal(0, 0.02, 128) for encoding in (first, second)]
+        cls.queries.append(0.45 * first + 0.55 * second)
+        cls.queries += [rng.normal(0, 0.1, 128) for _ in range(5)]
+        cls.queries.append(np.zeros(128))
+
+    def brute_force(self, face_encoding, tolerance):
+        face_encoding = np.asarray(face_encoding, dtype=np.float32).astype(np.float64)
+        distances = {
+            student_id: np.linalg.norm(encoding.astype(np.float32).astype(np.float64) - face_encoding)
+            for student_id, encoding in self.stored.items()
+        }
+        student_id = min(distances, key=distances.get)
+        if distances[student_id] < tolerance:
+            return student_id, distances[student_id]
+        return None, None
+
+    def assert_matches_brute_force(self, tolerance=0.6):
+        for face_encoding in self.queries:
+            expected_id, expected_distance = self.brute_force(face_encoding, tolerance)
+            student_id, distance = face_utils.find_closest_student(
+                face_encoding, list(self.stored), tolerance
+            )
+            self.assertEqual(student_id, expected_id)
+            if expected_distance is None:
+                self.assertIsNone(distance)
+            else:
+                self.assertAlmostEqual(distance, expected_distance, places=4)
+
+    def exact_paths_only(self):
+        """Keep matching off the HNSW index and the GPU"""
+        for patcher in (
+            mock.patch.object(face_utils, 'hnswlib', None),
+            mock.patch.object(face_utils, 'cupy', None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_legacy_and_current_encodings_are_both_loaded(self):
+        ids, matrix, norms = face_utils.get_encoding_matrix()
+        self.assertEqual(sorted(ids.tolist()), sorted(self.stored))
+        self.assertEqual(matrix.dtype, np.float32)
+        for row, student_id in enumerate(ids):
+            np.testing.assert_array_equal(matrix[row], self.stored[student_id].astype(np.float32))
+        np.testing.assert_allclose(norms, np.linalg.norm(matrix, axis=1), rtol=1e-6)
+
+    def test_numpy_path_matches_brute_force(self):
+        self.exact_paths_only()
+        with mock.patch.object(face_utils, 'nearest_encoding', None):
+            self.assert_matches_brute_force()
+
+    def test_numba_path_matches_brute_force(self):
+        if face_utils.nearest_encoding is None:
+            self.skipTest('numba is not installed')
+        self.exact_paths_only()
+        with mock.patch.object(face_utils, 'NUMBA_MIN_CANDIDATES', 1):
+            self.assert_matches_brute_force()
+
+    def test_norm_pruning_matches_brute_force(self):
+        # A tight tolerance makes the norm bound skip most students; it may
+        # only skip ones brute force would reject too
+        self.exact_paths_only()
+        with mock.patch.object(face_utils, 'nearest_encoding', None):
+            for tolerance in (0.05, 0.2, 0.6, 2.0):
+                self.assert_matches_brute_force(tolerance)
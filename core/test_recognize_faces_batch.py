@@ -0,0 +1,71 @@
+from unittest import mock
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from . import face_utils
+from .models import AttendanceRecord, Course, Department, Level, Student
+
+
+class RecognizeFacesBatchTests(TestCase):
+    url = '/api/recognize-faces/'
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(department_name='Computer Science', department_code='CSC')
+        level = Level.objects.create(level_name='100', level_code='L100')
+        cls.course = Course.objects.create(
+            course_code='CSC101', course_name='Intro to Computing', department=department, level=level
+        )
+        rng = np.random.default_rng(0)
+        cls.encodings = {}
+        for matric_number in ('CSC/001', 'CSC/002'):
+            encoding = rng.normal(0, 0.1, 128).astype(np.float32)
+            student = Student.objects.create(
+                first_name='Student', last_name=matric_number[-1], matric_number=matric_number,
+                email=f'{matric_number[-3:]}@example.com', department=department, level=level,
+                face_encoding=encoding.tobytes()
+            )
+            student.enrolled_courses.add(cls.course)
+            cls.encodings[matric_number] = encoding
+
+    def post_images(self, names):
+        images = [SimpleUploadedFile(name, b'image data', content_type='image/jpeg') for name in names]
+        return self.client.post(self.url, {'course_id': self.course.id, 'images': images})
+
+    def test_results_follow_upload_order(self):
+        # What each upload decodes to, keyed by file name so the mock sees the
+        # order the view passes the uploads in
+        encoded = {
+            'unreadable.jpg': None,
+            'second.jpg': [self.encodings['CSC/002']],
+            'empty.jpg': [],
+            'first.jpg': [self.encodings['CSC/001']],
+            'first_again.jpg': [self.encodings['CSC/001']],
+        }
+        with mock.patch.object(
+            face_utils, 'encode_uploaded_images',
+            side_effect=lambda image_files: [encoded[image.name] for image in image_files]
+        ):
+            response = self.post_images(list(encoded))
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['fail', 'success', 'fail', 'success', 'info'])
+        self.assertEqual(results[0]['message'], 'Failed to process image.')
+        self.assertEqual(results[1]['student']['matric_number'], 'CSC/002')
+        self.assertEqual(results[2]['message'], 'No face detected.')
+        self.assertEqual(results[3]['student']['matric_number'], 'CSC/001')
+        self.assertEqual(results[4]['student']['matric_number'], 'CSC/001')
+        self.assertEqual(results[4]['student']['existing_status'], 'present')
+        self.assertEqual(AttendanceRecord.objects.filter(course=self.course).count(), 2)
+
+    @override_settings(FACE_BATCH_MAX_IMAGES=2)
+    def test_too_many_images_are_rejected_before_encoding(self):
+        with mock.patch.object(face_utils, 'encode_uploaded_images') as encode_uploaded_images:
+            response = self.post_images(['a.jpg', 'b.jpg', 'c.jpg'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'fail')
+        encode_uploaded_images.assert_not_called()
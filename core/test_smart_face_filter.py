@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from .smart_face_filter import FaceBatch, SmartFaceFilter
+
+
+def face_sketch():
+    """Gray 120x120 crop with a lighter face oval, dark eyes and mouth and a nose line"""
+    image = np.full((120, 120), 150, dtype=np.uint8)
+    cv2.ellipse(image, (60, 60), (45, 55), 0, 0, 360, 190, -1)
+    for eye_x in (42, 78):
+        cv2.ellipse(image, (eye_x, 48), (9, 5), 0, 0, 360, 40, -1)
+    cv2.line(image, (60, 55), (60, 75), 110, 2)
+    cv2.ellipse(image, (60, 88), (16, 6), 0, 0, 360, 60, -1)
+    return image
+
+
+def flat_patch(brightness, noise=8):
+    """120x120 crop of a featureless region with sensor-like Gaussian noise"""
+    rng = np.random.default_rng(0)
+    return np.clip(rng.normal(brightness, noise, (120, 120)), 0, 255).astype(np.uint8)
+
+
+class RegionQualityTests(SimpleTestCase):
+    """
+    Pins region quality scores, so a change to the edge operator or its
+    threshold that shifts them (e.g. counting noise as edges) shows up here
+    """
+
+    def score(self, image):
+        face_filter = SmartFaceFilter()
+        tables = face_filter._build_quality_tables(image)
+        return face_filter._analyze_face_region_quality((0, 0, 120, 120), tables)
+
+    def kept(self, image):
+        """Whether the quality filter keeps one detection covering the whole image"""
+        batch = FaceBatch.from_detections([{'bbox': [0, 0, 120, 120], 'confidence': 0.9}])
+        keep = np.ones(1, dtype=bool)
+        SmartFaceFilter()._filter_by_face_quality(batch, keep, image, None)
+        return bool(keep[0])
+
+    def test_face_scores_well_above_the_removal_threshold(self):
+        self.assertAlmostEqual(self.score(face_sketch()), 68.57, places=2)
+
+    def test_noise_on_flat_regions_is_not_counted_as_edges(self):
+        self.assertAlmostEqual(self.score(flat_patch(25)), 5.92, places=2)
+        self.assertAlmostEqual(self.score(flat_patch(128)), 26.31, places=2)
+        self.assertAlmostEqual(self.score(flat_patch(235)), 4.88, places=2)
+
+    def test_dark_and_bright_blank_regions_are_removed(self):
+        self.assertTrue(self.kept(cv2.cvtColor(face_sketch(), cv2.COLOR_GRAY2BGR)))
+        for brightness in (25, 235):
+            self.assertFalse(self.kept(cv2.cvtColor(flat_patch(brightness), cv2.COLOR_GRAY2BGR)))
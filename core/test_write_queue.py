@@ -0,0 +1,89 @@
+import queue
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, OperationalError
+from django.test import TransactionTestCase
+
+from . import write_queue
+from .models import UserActivity
+
+
+class WriteQueueTests(TransactionTestCase):
+    """
+    The background writer uses its own connection, so these tests commit for
+    real instead of running inside a TestCase transaction it couldn't see
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='auditor', password='secret')
+
+    def tearDown(self):
+        write_queue.flush()
+
+    def use_private_queue(self):
+        """Queue rows where no background thread drains them until flush()"""
+        for patcher in (
+            mock.patch.object(write_queue, '_ensure_worker'),
+            mock.patch.object(write_queue, '_queue', queue.Queue()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_activity(self, details='test'):
+        return UserActivity(
+            user=self.user, action='LOGIN', resource='auth', details=details,
+            ip_address='127.0.0.1'
+        )
+
+    def test_background_thread_writes_enqueued_rows(self):
+        for i in range(5):
+            write_queue.enqueue(self.make_activity(details=f'row {i}'))
+
+        deadline = time.monotonic() + 5
+        while UserActivity.objects.count() < 5 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self.assertEqual(
+            sorted(UserActivity.objects.values_list('details', flat=True)),
+            [f'row {i}' for i in range(5)]
+        )
+
+    def test_flush_writes_queued_rows_on_calling_thread(self):
+        self.use_private_queue()
+        write_queue.enqueue(self.make_activity())
+        write_queue.enqueue(self.make_activity())
+        self.assertEqual(UserActivity.objects.count(), 0)
+
+        write_queue.flush()
+
+        self.assertEqual(UserActivity.objects.count(), 2)
+
+    def test_locked_database_is_retried(self):
+        bulk_create = UserActivity.objects.bulk_create
+        side_effect = [OperationalError('database is locked'), bulk_create]
+
+        def flaky_bulk_create(instances):
+            outcome = side_effect.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome(instances)
+
+        self.use_private_queue()
+        with mock.patch.object(write_queue, 'RETRY_DELAY', 0), \
+                mock.patch.object(UserActivity.objects, 'bulk_create', side_effect=flaky_bulk_create):
+            write_queue.enqueue(self.make_activity())
+            write_queue.flush()
+
+        self.assertEqual(UserActivity.objects.count(), 1)
+
+    def test_failed_batch_falls_back_to_saving_each_row(self):
+        self.use_private_queue()
+        with mock.patch.object(UserActivity.objects, 'bulk_create', side_effect=DatabaseError('boom')), \
+                self.assertLogs('core.write_queue', 'WARNING'):
+            write_queue.enqueue(self.make_activity())
+            write_queue.enqueue(self.make_activity())
+            write_queue.flush()
+
+        self.assertEqual(UserActivity.objects.count(), 2)
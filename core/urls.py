@@ -26,6 +26,7 @@ urlpatterns = [
     # Legacy student and attendance endpoints (backward compatibility)
     path('register-student/', views.register_student, name='register_student'),
     path('recognize-face/', views.recognize_face, name='recognize_face'),
+    path('recognize-faces/', views.recognize_faces_batch, name='recognize_faces_batch'),
     path('get-students/', views.get_students, name='get_students'),
     path('get-attendance/', views.get_attendance_records, name='get_attendance_records'),
     
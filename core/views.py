@@ -2,7 +2,7 @@
 from rest_framework.permissions import BasePermission
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse, FileResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
 from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
@@ -11,10 +11,11 @@ from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.sessions.models import Session
 from django.core.mail import send_mail, get_connection, EmailMessage
 from django.conf import settings
-from django.db import connection, transaction
-from django.db.models import Count, Avg, Q, Sum
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Count, Avg, Q, Sum, Max
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.core.cache import cache
 
 from .models import (
     Student, AttendanceRecord, Attendance, AdminUser, 
@@ -23,9 +24,10 @@ from .models import (
     Level, Course, AttendanceSession, SessionCheckIn  # ADD THESE TWO
 )
 
+from .renderers import dumps
 from .serializers import (
     SystemSettingsSerializer, SystemSettingsUpdateSerializer, 
-    SystemStatsSerializer, SystemBackupSerializer,
+    SystemBackupSerializer,
     StudentSerializer, StudentListSerializer, StudentCreateSerializer,
     AttendanceSerializer, AttendanceRecordSerializer, AttendanceListSerializer,
     AttendanceCreateSerializer, AdminUserSerializer,
@@ -39,17 +41,16 @@ from .serializers import (
 )
 
 import numpy as np
-import face_recognition
+import cv2
 import json
 import datetime
 from datetime import timedelta
-from . import face_utils
+from . import face_utils, write_queue
 import csv
-import psutil
+import logging
 import os
 import zipfile
 import tempfile
-import time
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -91,6 +92,18 @@ from .adaptive_detector import AdaptiveFaceDetector
 # Get the User model
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+# Seconds the dashboard's system and security statistics are served from the
+# cache; the admin pages poll them and a minute of staleness is fine there
+STATS_CACHE_TIMEOUT = 60
+
+# SecuritySettings columns update_security_settings accepts from the client
+SECURITY_SETTINGS_FIELDS = frozenset(
+    field.name for field in SecuritySettings._meta.concrete_fields
+    if field.editable and not field.primary_key and not field.is_relation
+)
+
 class IsAuthenticatedNoCSRF(BasePermission):
     """
     Custom permission that checks authentication but bypasses CSRF
@@ -117,8 +130,13 @@ def check_teacher_course_access(user, course):
 
 
 def log_user_activity(user, action, resource, details, request, resource_id=None, status='success'):
-    """Log user activity - FIXED to accept resource_id parameter"""
-    UserActivity.objects.create(
+    """
+    Log user activity - FIXED to accept resource_id parameter
+    
+    With ACTIVITY_LOG_IN_BACKGROUND set, the row is written by the background
+    write queue in batches instead of with an INSERT on the request thread.
+    """
+    activity = UserActivity(
         user=user,
         action=action,
         resource=resource,
@@ -129,6 +147,10 @@ def log_user_activity(user, action, resource, details, request, resource_id=None
         session_id=request.session.session_key or '',
         status=status
     )
+    if getattr(settings, 'ACTIVITY_LOG_IN_BACKGROUND', False):
+        write_queue.enqueue(activity)
+    else:
+        activity.save()
 
 # --------------------------
 # Academic Structure ViewSets
@@ -219,7 +241,7 @@ class LevelViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Level.objects.prefetch_related('departments', 'specializations').all()
+        queryset = LevelSerializer.setup_eager_loading(Level.objects.all())
         if self.request.query_params.get('active_only') == 'true':
             queryset = queryset.filter(is_active=True)
         return queryset.order_by('level_name')
@@ -235,14 +257,12 @@ class LevelViewSet(ModelViewSet):
 class CourseViewSet(ModelViewSet):
     queryset = Course.objects.select_related(
         'department', 'level'
-    ).prefetch_related('specializations', 'teachers', 'enrolled_students').all()
+    ).prefetch_related('specializations', 'teachers').all()
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Course.objects.select_related(
-            'department', 'level'
-        ).prefetch_related('specializations', 'teachers', 'enrolled_students').all()
+        queryset = Course.objects.all()
         
         # Filter by teacher access
         user = self.request.user
@@ -265,6 +285,9 @@ class CourseViewSet(ModelViewSet):
         if self.request.query_params.get('active_only') == 'true':
             queryset = queryset.filter(status='active')
         
+        # Applied after the filters so the enrollment count is computed last
+        queryset = CourseSerializer.setup_eager_loading(queryset)
+        
         return queryset.order_by('course_code')
     
     def get_serializer_class(self):
@@ -290,7 +313,7 @@ class CourseViewSet(ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        students = course.enrolled_students.all()
+        students = StudentListSerializer.setup_eager_loading(course.enrolled_students.all())
         serializer = StudentListSerializer(students, many=True)
         return Response(serializer.data)
     
@@ -352,9 +375,7 @@ class StudentViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Student.objects.select_related(
-            'department', 'specialization', 'level'
-        ).prefetch_related('enrolled_courses').all()
+        queryset = Student.objects.all()
         
         # Filter by department, specialization, level
         department_id = self.request.query_params.get('department')
@@ -372,6 +393,12 @@ class StudentViewSet(ModelViewSet):
         if self.request.query_params.get('active_only') == 'true':
             queryset = queryset.filter(status='active')
         
+        # The list serializer doesn't render enrolled courses, so skip loading them
+        if self.action == 'list':
+            queryset = StudentListSerializer.setup_eager_loading(queryset)
+        else:
+            queryset = StudentSerializer.setup_eager_loading(queryset)
+        
         return queryset.order_by('first_name', 'last_name')
     
     def get_serializer_class(self):
@@ -401,7 +428,7 @@ class StudentViewSet(ModelViewSet):
     def courses(self, request, pk=None):
         """Get courses for this student"""
         student = self.get_object()
-        courses = student.enrolled_courses.all()
+        courses = CourseListSerializer.setup_eager_loading(student.enrolled_courses.all())
         serializer = CourseListSerializer(courses, many=True)
         return Response(serializer.data)
     
@@ -447,21 +474,27 @@ class StudentViewSet(ModelViewSet):
         """Get attendance summary for this student"""
         student = self.get_object()
         
-        # Get attendance records with course info
-        attendance_records = student.attendance_records.select_related('course').all()
-        
-        # Calculate summary statistics
-        total_records = attendance_records.count()
-        present_count = attendance_records.filter(status='present').count()
-        late_count = attendance_records.filter(status='late').count()
-        absent_count = attendance_records.filter(status='absent').count()
+        # Count records per (course, status) in one GROUP BY query instead of
+        # separate COUNTs per status and per enrolled course. order_by() drops
+        # the default ordering so it doesn't end up in the GROUP BY.
+        status_counts = {}
+        course_totals = {}
+        course_present_counts = {}
+        grouped_counts = student.attendance_records.order_by().values(
+            'course_id', 'status'
+        ).annotate(count=Count('id'))
+        
+        for row in grouped_counts:
+            status_counts[row['status']] = status_counts.get(row['status'], 0) + row['count']
+            course_totals[row['course_id']] = course_totals.get(row['course_id'], 0) + row['count']
+            if row['status'] == 'present':
+                course_present_counts[row['course_id']] = row['count']
         
         # Per course statistics
         course_stats = []
         for course in student.enrolled_courses.all():
-            course_records = attendance_records.filter(course=course)
-            course_total = course_records.count()
-            course_present = course_records.filter(status='present').count()
+            course_total = course_totals.get(course.id, 0)
+            course_present = course_present_counts.get(course.id, 0)
             
             course_stats.append({
                 'course_code': course.course_code,
@@ -472,10 +505,10 @@ class StudentViewSet(ModelViewSet):
             })
         
         summary = {
-            'total_records': total_records,
-            'present_count': present_count,
-            'late_count': late_count,
-            'absent_count': absent_count,
+            'total_records': sum(status_counts.values()),
+            'present_count': status_counts.get('present', 0),
+            'late_count': status_counts.get('late', 0),
+            'absent_count': status_counts.get('absent', 0),
             'overall_attendance_rate': student.attendance_rate,
             'course_statistics': course_stats
         }
@@ -516,7 +549,7 @@ class AttendanceViewSet(ModelViewSet):
                 status=status.HTTP_201_CREATED
             )
         except Exception as e:
-            print(f"❌ Error creating attendance record: {e}")
+            logger.exception("Error creating attendance record")
             return Response(
                 {'error': str(e), 'details': 'Failed to mark attendance'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -560,43 +593,54 @@ def register_student(request):
                 'message': 'Invalid academic structure selection.'
             }, status=400)
 
-        # Check for existing student
+        # Check for existing student. Both columns are unique, so this is two
+        # index lookups; doing it before encoding spares a duplicate the face
+        # detection cost.
         if Student.objects.filter(Q(matric_number=matric_number) | Q(email=email)).exists():
             return JsonResponse({
                 'status': 'fail', 
                 'message': 'Student with this matriculation number or email already exists.'
             }, status=400)
 
-        # Process face image
-        image = face_utils.preprocess_image(image_file)
-        if image is None:
+        # Decode the image and extract face encodings in the encoding pool
+        try:
+            face_encodings = face_utils.encode_uploaded_image(image_file)
+        except face_utils.EncodingTimeout:
+            return JsonResponse({'status': 'fail', 'message': 'Face processing timed out, please try again.'}, status=503)
+        if face_encodings is None:
             return JsonResponse({'status': 'fail', 'message': 'Failed to load image.'}, status=400)
 
-        # Extract face encoding
-        face_encodings = face_recognition.face_encodings(image)
         if not face_encodings:
             return JsonResponse({'status': 'fail', 'message': 'No face detected in image.'}, status=400)
 
         face_encoding = face_encodings[0]
 
-        # Create student
-        with transaction.atomic():
-            student = Student.objects.create(
-                first_name=first_name,
-                last_name=last_name,
-                matric_number=matric_number,
-                email=email,
-                phone=phone,
-                address=address,
-                department=department,
-                specialization=specialization,
-                level=level,
-                face_encoding=face_encoding.tobytes(),
-                face_encoding_model='cnn'
-            )
+        # Create student. The unique matric_number/email indexes reject a
+        # duplicate registered since the check above (e.g. a double submit
+        # still encoding when the first one committed).
+        try:
+            with transaction.atomic():
+                student = Student.objects.create(
+                    first_name=first_name,
+                    last_name=last_name,
+                    matric_number=matric_number,
+                    email=email,
+                    phone=phone,
+                    address=address,
+                    department=department,
+                    specialization=specialization,
+                    level=level,
+                    face_encoding=face_utils.encode_face_encoding(face_encoding),
+                    face_encoding_model='cnn'
+                )
             
-            # Auto-assign courses
-            student.auto_assign_courses()
+                # Auto-assign courses
+                student.auto_assign_courses()
+        except IntegrityError:
+            return JsonResponse({
+                'status': 'fail', 
+                'message': 'Student with this matriculation number or email already exists.'
+            }, status=400)
 
         # Log activity
         if request.user.is_authenticated:
@@ -619,6 +663,93 @@ def register_student(request):
             'message': f'Registration failed: {str(e)}'
         }, status=500)
 
+def _check_in_face(request, course, face_encoding, enrolled_ids):
+    """
+    Match a face encoding against a course's enrolled students and mark attendance
+    
+    Returns the JSON payload for the outcome: 'success' with the new check-in,
+    'info' if the student was already marked today, or 'fail' if nobody matched.
+    """
+    # Compare with enrolled students in one vectorized pass
+    tolerance = 0.6
+    best_match_id, best_distance = face_utils.find_closest_student(
+        face_encoding, enrolled_ids, tolerance
+    )
+    best_match = None
+    if best_match_id is not None:
+        best_match = Student.objects.select_related('department').get(id=best_match_id)
+
+    if best_match:
+        # Create attendance record. The post_save signal recalculates the
+        # attendance rate on best_match itself (the record's cached student).
+        # The (student, course, attendance_date) unique constraint rejects a
+        # second check-in the same day, so the common first check-in costs a
+        # single INSERT instead of a lookup followed by an INSERT.
+        try:
+            with transaction.atomic():
+                attendance_record = AttendanceRecord.objects.create(
+                    student=best_match,
+                    course=course,
+                    status='present',
+                    recognition_model='cnn'
+                )
+        except IntegrityError:
+            existing_record = AttendanceRecord.objects.filter(
+                student=best_match,
+                course=course,
+                attendance_date=timezone.now().date()
+            ).only('status', 'check_in_time').first()
+            if existing_record is None:
+                raise
+                
+            return {
+                'status': 'info',
+                'message': f'{best_match.full_name} already marked {existing_record.status} today for {course.course_code}.',
+                'student': {
+                    'name': best_match.full_name,
+                    'matric_number': best_match.matric_number,
+                    'course': course.course_code,
+                    'existing_status': existing_record.status,
+                    'time': existing_record.check_in_time.strftime('%H:%M')
+                }
+            }
+
+        # Log activity
+        if request.user.is_authenticated:
+            log_user_activity(
+                request.user, 'USE_FACE_RECOGNITION', 'attendance',
+                f"Face recognition successful for {best_match.full_name} in {course.course_code}",
+                request
+            )
+
+        return {
+            'status': 'success',
+            'message': f'Welcome {best_match.full_name}! Attendance marked for {course.course_code}.',
+            'student': {
+                'id': best_match.id,
+                'name': best_match.full_name,
+                'matric_number': best_match.matric_number,
+                'department': best_match.department.department_name,
+                'course': course.course_code,
+                'confidence': round((1 - best_distance) * 100, 2),
+                'attendance_rate': float(best_match.attendance_rate)
+            }
+        }
+    else:
+        # Log failed recognition
+        if request.user.is_authenticated:
+            log_user_activity(
+                request.user, 'USE_FACE_RECOGNITION', 'attendance',
+                f"Face recognition failed for course {course.course_code}",
+                request, status='failed'
+            )
+
+        return {
+            'status': 'fail',
+            'message': 'Face not recognized or student not enrolled in this course.'
+        }
+
+
 @csrf_exempt
 def recognize_face(request):
     """Updated face recognition with course selection"""
@@ -646,107 +777,98 @@ def recognize_face(request):
             if not check_teacher_course_access(request.user, course):
                 return JsonResponse({'status': 'fail', 'message': 'Access denied to this course.'}, status=403)
 
-        # Process image
-        image = face_utils.preprocess_image(image_file)
-        if image is None:
+        # Decode the image and extract face encodings in the encoding pool
+        try:
+            face_encodings = face_utils.encode_uploaded_image(image_file)
+        except face_utils.EncodingTimeout:
+            return JsonResponse({'status': 'fail', 'message': 'Face processing timed out, please try again.'}, status=503)
+        if face_encodings is None:
             return JsonResponse({'status': 'fail', 'message': 'Failed to process image.'}, status=400)
 
-        # Extract face encoding
-        face_encodings = face_recognition.face_encodings(image)
         if not face_encodings:
             return JsonResponse({'status': 'fail', 'message': 'No face detected.'}, status=400)
 
         unknown_encoding = face_encodings[0]
 
-        # Get enrolled students for this course
-        enrolled_students = course.enrolled_students.filter(status='active')
+        # Get enrolled students for this course; the ids double as the
+        # emptiness check, so this is the only query for them
+        enrolled_ids = list(
+            course.enrolled_students.filter(status='active').values_list('id', flat=True)
+        )
         
-        if not enrolled_students.exists():
+        if not enrolled_ids:
             return JsonResponse({'status': 'fail', 'message': 'No students enrolled in this course.'}, status=400)
 
-        # Compare with enrolled students
-        best_match = None
-        best_distance = float('inf')
-        tolerance = 0.6
+        return JsonResponse(_check_in_face(request, course, unknown_encoding, enrolled_ids))
 
-        for student in enrolled_students:
-            try:
-                stored_encoding = np.frombuffer(student.face_encoding, dtype=np.float64)
-                distance = face_recognition.face_distance([stored_encoding], unknown_encoding)[0]
-                
-                if distance < tolerance and distance < best_distance:
-                    best_distance = distance
-                    best_match = student
-            except Exception as e:
-                continue
+    except Exception as e:
+        return JsonResponse({
+            'status': 'fail',
+            'message': f'Recognition failed: {str(e)}'
+        }, status=500)
 
-        if best_match:
-            # Check if already marked present today
-            today = timezone.now().date()
-            existing_record = AttendanceRecord.objects.filter(
-                student=best_match,
-                course=course,
-                attendance_date=today
-            ).first()
+@csrf_exempt
+def recognize_faces_batch(request):
+    """
+    Face recognition for several images of the same course in one request
+    
+    Images are uploaded as 'images'; their faces are encoded in parallel across
+    the encoding pool and each is checked in like recognize_face. Results come
+    back in upload order.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'fail', 'message': 'Only POST requests allowed.'}, status=405)
 
-            if existing_record:
-                return JsonResponse({
-                    'status': 'info',
-                    'message': f'{best_match.full_name} already marked {existing_record.status} today for {course.course_code}.',
-                    'student': {
-                        'name': best_match.full_name,
-                        'matric_number': best_match.matric_number,
-                        'course': course.course_code,
-                        'existing_status': existing_record.status,
-                        'time': existing_record.check_in_time.strftime('%H:%M')
-                    }
-                })
+    try:
+        image_files = request.FILES.getlist('images')
+        course_id = request.POST.get('course_id')
+        
+        if not image_files:
+            return JsonResponse({'status': 'fail', 'message': 'No images provided.'}, status=400)
+        
+        max_images = getattr(settings, 'FACE_BATCH_MAX_IMAGES', 20)
+        if len(image_files) > max_images:
+            return JsonResponse({
+                'status': 'fail',
+                'message': f'Too many images: at most {max_images} per request.'
+            }, status=400)
+        
+        if not course_id:
+            return JsonResponse({'status': 'fail', 'message': 'Course ID is required.'}, status=400)
 
-            # Create attendance record
-            attendance_record = AttendanceRecord.objects.create(
-                student=best_match,
-                course=course,
-                status='present',
-                recognition_model='cnn'
-            )
+        # Validate course
+        try:
+            course = Course.objects.get(id=course_id, status='active')
+        except Course.DoesNotExist:
+            return JsonResponse({'status': 'fail', 'message': 'Invalid course.'}, status=400)
 
-            # Update attendance rate
-            best_match.calculate_attendance_rate()
+        # Check teacher access
+        if request.user.is_authenticated and hasattr(request.user, 'role'):
+            if not check_teacher_course_access(request.user, course):
+                return JsonResponse({'status': 'fail', 'message': 'Access denied to this course.'}, status=403)
 
-            # Log activity
-            if request.user.is_authenticated:
-                log_user_activity(
-                    request.user, 'USE_FACE_RECOGNITION', 'attendance',
-                    f"Face recognition successful for {best_match.full_name} in {course.course_code}",
-                    request
-                )
+        enrolled_ids = list(
+            course.enrolled_students.filter(status='active').values_list('id', flat=True)
+        )
+        
+        if not enrolled_ids:
+            return JsonResponse({'status': 'fail', 'message': 'No students enrolled in this course.'}, status=400)
 
-            return JsonResponse({
-                'status': 'success',
-                'message': f'Welcome {best_match.full_name}! Attendance marked for {course.course_code}.',
-                'student': {
-                    'id': best_match.id,
-                    'name': best_match.full_name,
-                    'matric_number': best_match.matric_number,
-                    'department': best_match.department.department_name,
-                    'course': course.course_code,
-                    'confidence': round((1 - best_distance) * 100, 2),
-                    'attendance_rate': float(best_match.attendance_rate)
-                }
-            })
-        else:
-            # Log failed recognition
-            if request.user.is_authenticated:
-                log_user_activity(
-                    request.user, 'USE_FACE_RECOGNITION', 'attendance',
-                    f"Face recognition failed for course {course.course_code}",
-                    request, status='failed'
-                )
+        try:
+            encoded_images = face_utils.encode_uploaded_images(image_files)
+        except face_utils.EncodingTimeout:
+            return JsonResponse({'status': 'fail', 'message': 'Face processing timed out, please try again.'}, status=503)
+
+        results = []
+        for face_encodings in encoded_images:
+            if face_encodings is None:
+                results.append({'status': 'fail', 'message': 'Failed to process image.'})
+            elif not face_encodings:
+                results.append({'status': 'fail', 'message': 'No face detected.'})
+            else:
+                results.append(_check_in_face(request, course, face_encodings[0], enrolled_ids))
 
-            return JsonResponse({
-                'status': 'fail',
-                'message': 'Face not recognized or student not enrolled in this course.'
-            })
+        return JsonResponse({'status': 'success', 'results': results})
 
     except Exception as e:
         return JsonResponse({
@@ -837,18 +959,30 @@ def course_stats(request):
     if hasattr(user, 'role') and user.role == 'teacher':
         courses = courses.filter(teachers=user)
     
+    # Attendance is counted in its own GROUP BY query; joining it alongside
+    # enrolled_students would multiply the two relations' rows
+    total_records, present_records = {}, {}
+    attendance_counts = AttendanceRecord.objects.filter(course__in=courses).values(
+        'course_id', 'status'
+    ).annotate(count=Count('id')).order_by()
+    for row in attendance_counts:
+        course_id = row['course_id']
+        total_records[course_id] = total_records.get(course_id, 0) + row['count']
+        if row['status'] == 'present':
+            present_records[course_id] = row['count']
+    
     courses = courses.annotate(
-        enrolled_students_count=Count('enrolled_students', filter=Q(enrolled_students__status='active')),
-        total_attendance_records=Count('attendance_records'),
+        enrolled_students_count=Count(
+            'enrolled_students', filter=Q(enrolled_students__status='active')
+        ),
     ).select_related('department', 'level').order_by('course_code')
     
     course_data = []
     for course in courses:
         # Calculate average attendance rate for this course
-        attendance_records = course.attendance_records.all()
-        if attendance_records.exists():
-            present_count = attendance_records.filter(status='present').count()
-            avg_rate = (present_count / attendance_records.count()) * 100
+        total = total_records.get(course.id, 0)
+        if total:
+            avg_rate = (present_records.get(course.id, 0) / total) * 100
         else:
             avg_rate = 0
         
@@ -856,7 +990,7 @@ def course_stats(request):
             'course_code': course.course_code,
             'course_name': course.course_name,
             'enrolled_students': course.enrolled_students_count,
-            'total_attendance_records': course.total_attendance_records,
+            'total_attendance_records': total,
             'average_attendance_rate': round(avg_rate, 2)
         })
     
@@ -900,15 +1034,15 @@ def manage_student_enrollment(request):
     if not check_role_permission(request.user, ['superadmin', 'staff']):
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    serializer = StudentEnrollmentSerializer(data=request.data)
+    serializer = StudentEnrollmentSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        student_id = serializer.validated_data['student_id']
         course_ids = serializer.validated_data['course_ids']
         
-        student = Student.objects.get(id=student_id)
-        courses = Course.objects.filter(id__in=course_ids, status='active')
+        # Fetched by the serializer during validation
+        student = serializer.context['student']
         
-        student.enrolled_courses.set(courses)
+        # course_ids were already checked against active courses by the serializer
+        student.enrolled_courses.set(course_ids)
         
         log_user_activity(
             request.user, 'UPDATE_STUDENT', 'students',
@@ -918,7 +1052,7 @@ def manage_student_enrollment(request):
         
         return Response({
             'message': f'Updated enrollment for {student.full_name}',
-            'enrolled_courses': courses.count()
+            'enrolled_courses': len(course_ids)
         })
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -934,7 +1068,9 @@ def bulk_enrollment(request):
     if serializer.is_valid():
         data = serializer.validated_data
         course_ids = data['course_ids']
-        courses = Course.objects.filter(id__in=course_ids, status='active')
+        active_course_ids = list(
+            Course.objects.filter(id__in=course_ids, status='active').values_list('id', flat=True)
+        )
         
         # Build student filter
         student_filter = Q(status='active')
@@ -946,24 +1082,32 @@ def bulk_enrollment(request):
         if data.get('level_id'):
             student_filter &= Q(level_id=data['level_id'])
         
-        students = Student.objects.filter(student_filter)
-        
-        # Perform bulk enrollment
-        enrolled_count = 0
-        for student in students:
-            student.enrolled_courses.add(*courses)
-            enrolled_count += 1
+        student_ids = list(Student.objects.filter(student_filter).values_list('id', flat=True))
+        
+        # Perform bulk enrollment - insert the through rows directly, skipping pairs
+        # that already exist
+        Enrollment = Student.enrolled_courses.through
+        Enrollment.objects.bulk_create(
+            [
+                Enrollment(student_id=student_id, course_id=course_id)
+                for student_id in student_ids
+                for course_id in active_course_ids
+            ],
+            ignore_conflicts=True,
+            batch_size=1000
+        )
+        enrolled_count = len(student_ids)
         
         log_user_activity(
             request.user, 'MANAGE_COURSES', 'courses',
-            f"Bulk enrolled {enrolled_count} students in {courses.count()} courses",
+            f"Bulk enrolled {enrolled_count} students in {len(active_course_ids)} courses",
             request
         )
         
         return Response({
             'message': f'Bulk enrollment completed',
             'students_enrolled': enrolled_count,
-            'courses_count': courses.count()
+            'courses_count': len(active_course_ids)
         })
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -971,46 +1115,18 @@ def bulk_enrollment(request):
 # --------------------------
 # System Management APIs (Updated)
 # --------------------------
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def system_stats(request):
-    """Get comprehensive system statistics"""
-    if not check_role_permission(request.user, ['superadmin', 'staff']):
-        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
-    
-    # Get database size
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size();")
-        db_size = cursor.fetchone()[0] if cursor.fetchone() else 0
-    
-    # Get storage usage
-    storage_used = psutil.disk_usage('/').used
-    
-    # Get system uptime (simplified)
-    uptime_seconds = time.time() - psutil.boot_time()
-    uptime_str = str(timedelta(seconds=int(uptime_seconds)))
-    
-    # Get last backup
-    last_backup = SystemBackup.objects.first()
-    last_backup_str = last_backup.created_at.strftime('%Y-%m-%d %H:%M') if last_backup else 'Never'
-    
-    stats = {
-        'total_students': Student.objects.count(),
-        'total_users': AdminUser.objects.count(),
-        'total_attendance_records': AttendanceRecord.objects.count(),
-        'total_courses': Course.objects.count(),
-        'total_departments': Department.objects.count(),
-        'total_specializations': Specialization.objects.count(),
-        'total_levels': Level.objects.count(),
-        'database_size': f"{db_size / (1024*1024):.2f} MB",
-        'storage_used': f"{storage_used / (1024*1024*1024):.2f} GB",
-        'system_uptime': uptime_str,
-        'last_backup': last_backup_str,
-        'system_version': '2.0.0'
-    }
-    
-    serializer = SystemStatsSerializer(stats)
-    return Response(serializer.data)
+def get_database_size():
+    """Size of the default database in bytes, or None if the backend can't tell"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_database_size(current_database())")
+            return cursor.fetchone()[0]
+    if connection.vendor == 'sqlite':
+        try:
+            return os.stat(connection.settings_dict['NAME']).st_size
+        except OSError:
+            return None
+    return None
 
 # --------------------------
 # Legacy Compatibility Functions
@@ -1044,8 +1160,15 @@ def get_students(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_attendance_records(request):
-    """Legacy endpoint for getting attendance records"""
-    records = AttendanceRecord.objects.select_related('student', 'course').all()
+    """
+    Legacy endpoint for getting attendance records
+    
+    The list is streamed: rows are read as tuples in chunks and encoded one by
+    one, so memory stays flat however wide the date range is.
+    """
+    # Only the columns the legacy format renders; in particular the joined
+    # student row's encrypted face_encoding blob is never fetched
+    records = AttendanceRecord.objects.all()
     
     # Add filters
     student_id = request.query_params.get('student_id')
@@ -1060,29 +1183,40 @@ def get_attendance_records(request):
     if date_from:
         records = records.filter(check_in_time__date__gte=date_from)
     
-    # Legacy format
-    record_data = []
-    for record in records:
-        record_data.append({
-            'id': record.id,
-            'student': {
-                'id': record.student.id,
-                'name': record.student.full_name,
-                'matric_number': record.student.matric_number,
-            },
-            'course': {
-                'id': record.course.id,
-                'code': record.course.course_code,
-                'name': record.course.course_name,
-            },
-            'date': record.check_in_time.date().isoformat(),
-            'time_in': record.check_in_time.time().isoformat(),
-            'time_out': record.check_out_time.time().isoformat() if record.check_out_time else None,
-            'status': record.status,
-            'created_at': record.created_at.isoformat(),
-        })
+    rows = records.values_list(
+        'id', 'status', 'check_in_time', 'check_out_time', 'created_at',
+        'student__id', 'student__first_name', 'student__last_name', 'student__matric_number',
+        'course__id', 'course__course_code', 'course__course_name'
+    ).iterator(chunk_size=2000)
+    
+    def stream():
+        # Legacy format
+        separator = b'['
+        for (record_id, record_status, check_in_time, check_out_time, created_at,
+             student_pk, first_name, last_name, matric_number,
+             course_pk, course_code, course_name) in rows:
+            yield separator + dumps({
+                'id': record_id,
+                'student': {
+                    'id': student_pk,
+                    'name': f"{first_name} {last_name}",
+                    'matric_number': matric_number,
+                },
+                'course': {
+                    'id': course_pk,
+                    'code': course_code,
+                    'name': course_name,
+                },
+                'date': check_in_time.date().isoformat(),
+                'time_in': check_in_time.time().isoformat(),
+                'time_out': check_out_time.time().isoformat() if check_out_time else None,
+                'status': record_status,
+                'created_at': created_at.isoformat(),
+            })
+            separator = b','
+        yield b'[]' if separator == b'[' else b']'
     
-    return Response(record_data)
+    return StreamingHttpResponse(stream(), content_type='application/json')
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -1237,16 +1371,19 @@ def session_based_attendance(request):
         # Process face image (reuse existing face recognition logic)
         from . import face_utils
         
-        image = face_utils.preprocess_image(image_file)
-        if image is None:
+        try:
+            face_encodings = face_utils.encode_uploaded_image(image_file)
+        except face_utils.EncodingTimeout:
+            return Response({
+                'success': False,
+                'message': 'Face processing timed out, please try again'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if face_encodings is None:
             return Response({
                 'success': False,
                 'message': 'Failed to process image'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Extract face encoding
-        import face_recognition
-        face_encodings = face_recognition.face_encodings(image)
         if not face_encodings:
             return Response({
                 'success': False,
@@ -1257,20 +1394,10 @@ def session_based_attendance(request):
         
         # Find matching student in enrolled students
         enrolled_students = session.course.enrolled_students.filter(status='active')
-        best_match = None
-        best_distance = float('inf')
-        
-        for student in enrolled_students:
-            if student.face_encoding:
-                try:
-                    stored_encoding = np.frombuffer(student.face_encoding, dtype=np.float64)
-                    distance = face_recognition.face_distance([stored_encoding], face_encoding)[0]
-                    
-                    if distance < 0.6 and distance < best_distance:  # Threshold for recognition
-                        best_match = student
-                        best_distance = distance
-                except Exception:
-                    continue
+        best_match_id, best_distance = face_utils.find_closest_student(
+            face_encoding, enrolled_students.values_list('id', flat=True), 0.6  # Threshold for recognition
+        )
+        best_match = Student.objects.get(id=best_match_id) if best_match_id is not None else None
         
         if not best_match:
             return Response({
@@ -1409,49 +1536,85 @@ def current_user(request):
 def system_stats(request):
     """Get comprehensive system statistics"""
     try:
+        stats = cache.get('system_stats')
+        if stats is not None:
+            return Response(stats)
+        
+        now = timezone.now()
+        day_ago = now - timedelta(days=1)
+        today = now.date()
+        
+        # Each table is read once: conditional aggregates where the counts
+        # filter the same table, and one SELECT for the plain row counts
+        user_counts = User.objects.aggregate(
+            total_users=Count('id'),
+            active_users=Count('id', filter=Q(is_active=True)),
+            admin_users=Count('id', filter=Q(is_superuser=True)),
+        )
+        
+        counted_models = [Student, Course, Department, AttendanceRecord]
+        count_sql = "SELECT " + ", ".join(
+            f"(SELECT COUNT(*) FROM {connection.ops.quote_name(model._meta.db_table)})"
+            for model in counted_models
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(count_sql)
+            total_students, total_courses, total_departments, attendance_records = cursor.fetchone()
+        
+        login_counts = {'recent_logins': 0, 'failed_logins_today': 0}
+        if 'LoginAttempt' in globals():
+            # The last 24 hours always include today so far
+            login_counts = LoginAttempt.objects.filter(timestamp__gte=day_ago).aggregate(
+                recent_logins=Count('id', filter=Q(success=True)),
+                failed_logins_today=Count('id', filter=Q(success=False, timestamp__gte=today)),
+            )
+        
+        backup_stats = {'last_backup': None, 'total_backups': 0}
+        if 'SystemBackup' in globals():
+            backup_stats = SystemBackup.objects.aggregate(
+                last_backup=Max('created_at'), total_backups=Count('id')
+            )
+        last_backup = backup_stats['last_backup']
+        db_size = get_database_size()
+        
         # Basic system stats
         stats = {
             'system_health': {
-                'database_size': '50MB',  # You can calculate this dynamically
+                'database_size': f"{db_size / (1024*1024):.2f} MB" if db_size is not None else 'Unknown',
                 'uptime': '15 days, 3 hours',
                 'memory_usage': '45%',
                 'cpu_usage': '12%',
                 'disk_usage': '23%'
             },
             'user_stats': {
-                'total_users': User.objects.count(),
-                'active_users': User.objects.filter(is_active=True).count(),
-                'admin_users': User.objects.filter(is_superuser=True).count(),
-                'recent_logins': LoginAttempt.objects.filter(
-                    success=True,
-                    timestamp__gte=timezone.now() - timedelta(days=1)
-                ).count() if 'LoginAttempt' in globals() else 0
+                'total_users': user_counts['total_users'],
+                'active_users': user_counts['active_users'],
+                'admin_users': user_counts['admin_users'],
+                'recent_logins': login_counts['recent_logins']
             },
             'data_stats': {
-                'total_students': Student.objects.count(),
-                'total_courses': Course.objects.count(),
-                'total_departments': Department.objects.count(),
-                'attendance_records': AttendanceRecord.objects.count()
+                'total_students': total_students,
+                'total_courses': total_courses,
+                'total_departments': total_departments,
+                'attendance_records': attendance_records
             },
             'security_stats': {
-                'failed_logins_today': LoginAttempt.objects.filter(
-                    success=False,
-                    timestamp__gte=timezone.now().date()
-                ).count() if 'LoginAttempt' in globals() else 0,
+                'failed_logins_today': login_counts['failed_logins_today'],
                 'active_sessions': ActiveSession.objects.filter(
                     is_active=True
                 ).count() if 'ActiveSession' in globals() else 0,
                 'user_activities_today': UserActivity.objects.filter(
-                    timestamp__gte=timezone.now().date()
+                    timestamp__gte=today
                 ).count() if 'UserActivity' in globals() else 0
             },
             'backup_stats': {
-                'last_backup': SystemBackup.objects.filter().order_by('-created_at').first().created_at.isoformat() if SystemBackup.objects.exists() and 'SystemBackup' in globals() else None,
-                'total_backups': SystemBackup.objects.count() if 'SystemBackup' in globals() else 0,
+                'last_backup': last_backup.isoformat() if last_backup else None,
+                'total_backups': backup_stats['total_backups'],
                 'backup_size': '250MB'
             }
         }
         
+        cache.set('system_stats', stats, STATS_CACHE_TIMEOUT)
         return Response(stats)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
@@ -1474,6 +1637,7 @@ def get_admin_users(request):
         # Format the data for frontend
         admin_users = []
         for user in users:
+            date_joined = user.date_joined.isoformat()
             admin_users.append({
                 'id': user.id,
                 'name': f"{user.first_name} {user.last_name}".strip() or user.username,
@@ -1495,9 +1659,9 @@ def get_admin_users(request):
                 'status': 'Active',
                 'is_active': user.is_active,
                 'last_login': user.last_login.isoformat() if user.last_login else None,
-                'date_joined': user.date_joined.isoformat(),
-                'created_at': user.date_joined.isoformat(),
-                'updated_at': user.date_joined.isoformat(),
+                'date_joined': date_joined,
+                'created_at': date_joined,
+                'updated_at': date_joined,
                 'permissions': []
             })
         
@@ -1513,7 +1677,7 @@ def create_admin_user(request):
         if not request.user.is_superuser:
             return Response({'error': 'Permission denied'}, status=403)
         
-        data = json.loads(request.body)
+        data = request.data
         
         # Extract name parts
         name = data.get('name', '')
@@ -1637,21 +1801,26 @@ def get_user_activities(request):
         if status_filter and status_filter != 'all':
             queryset = queryset.filter(status=status_filter)
         
-        # Get activities
-        activities = queryset.select_related('user').order_by('-timestamp')[:100]
-        
-        result = []
-        for activity in activities:
-            result.append({
-                'id': activity.id,
-                'user': activity.user.username,
-                'action': activity.action,
-                'resource': activity.resource,
-                'details': activity.details,
-                'ip_address': activity.ip_address,
-                'status': activity.status,
-                'timestamp': activity.timestamp.isoformat()
-            })
+        # Get activities as plain tuples; the join only brings the username
+        activities = queryset.order_by('-timestamp').values_list(
+            'id', 'user__username', 'action', 'resource', 'details', 'ip_address', 'status',
+            'timestamp'
+        )[:100]
+        
+        result = [
+            {
+                'id': activity_id,
+                'user': username,
+                'action': action,
+                'resource': resource,
+                'details': details,
+                'ip_address': ip_address,
+                'status': activity_status,
+                'timestamp': timestamp.isoformat()
+            }
+            for (activity_id, username, action, resource, details, ip_address,
+                 activity_status, timestamp) in activities
+        ]
         
         return Response(result)
     except Exception as e:
@@ -1670,6 +1839,8 @@ def get_login_attempts(request):
         
         attempts = LoginAttempt.objects.filter(
             timestamp__gte=since_date
+        ).only(
+            'id', 'username', 'success', 'ip_address', 'user_agent', 'timestamp'
         ).order_by('-timestamp')[:50]
         
         result = []
@@ -1697,7 +1868,9 @@ def get_active_sessions(request):
         
         sessions = ActiveSession.objects.filter(
             is_active=True
-        ).select_related('user').order_by('-last_activity')
+        ).select_related('user').only(
+            'id', 'ip_address', 'user_agent', 'last_activity', 'created_at', 'user__username'
+        ).order_by('-last_activity')
         
         result = []
         for session in sessions:
@@ -1720,6 +1893,11 @@ def get_security_statistics(request):
     """Get security statistics"""
     try:
         days = int(request.GET.get('days', 7))
+        cache_key = f'security_stats:{days}'
+        stats = cache.get(cache_key)
+        if stats is not None:
+            return Response(stats)
+        
         since_date = timezone.now() - timedelta(days=days)
         
         stats = {
@@ -1733,15 +1911,19 @@ def get_security_statistics(request):
         
         if 'LoginAttempt' in globals():
             login_attempts = LoginAttempt.objects.filter(timestamp__gte=since_date)
-            stats['total_login_attempts'] = login_attempts.count()
-            stats['successful_logins'] = login_attempts.filter(success=True).count()
-            stats['failed_logins'] = login_attempts.filter(success=False).count()
-            stats['unique_users'] = login_attempts.values('username').distinct().count()
+            # All four counts from one scan of the window
+            stats.update(login_attempts.aggregate(
+                total_login_attempts=Count('id'),
+                successful_logins=Count('id', filter=Q(success=True)),
+                failed_logins=Count('id', filter=Q(success=False)),
+                unique_users=Count('username', distinct=True),
+            ))
         
         if 'UserActivity' in globals():
             activities = UserActivity.objects.filter(timestamp__gte=since_date)
             stats['suspicious_activities'] = activities.filter(status='warning').count()
         
+        cache.set(cache_key, stats, STATS_CACHE_TIMEOUT)
         return Response(stats)
     except Exception as e:
         return Response({
@@ -1794,7 +1976,7 @@ def get_system_settings(request):
     """Get system settings"""
     try:
         if 'SystemSettings' in globals():
-            settings = SystemSettings.objects.first()
+            settings = SystemSettings.get_cached_settings()
             if settings:
                 return Response({
                     'school_name': settings.school_name,
@@ -1829,7 +2011,7 @@ def update_system_settings(request):
         if not request.user.is_superuser:
             return Response({'error': 'Permission denied'}, status=403)
         
-        data = json.loads(request.body)
+        data = request.data
         
         if 'SystemSettings' in globals():
             settings, created = SystemSettings.objects.get_or_create(defaults=data)
@@ -1935,7 +2117,7 @@ def update_admin_user(request, user_id):
             return Response({'error': 'User not found'}, status=404)
         
         if request.method == 'PUT':
-            data = json.loads(request.body)
+            data = request.data
             
             # Update basic user fields
             if 'name' in data:
@@ -2056,16 +2238,18 @@ def update_security_settings(request):
         if not request.user.is_superuser:
             return Response({'error': 'Permission denied'}, status=403)
         
-        data = json.loads(request.body)
+        data = request.data
         
         # If SecuritySettings model exists, update it
         if 'SecuritySettings' in globals():
-            settings, created = SecuritySettings.objects.get_or_create(defaults=data)
-            if not created:
-                for key, value in data.items():
-                    if hasattr(settings, key):
-                        setattr(settings, key, value)
-                settings.save()
+            changed = {key: value for key, value in data.items() if key in SECURITY_SETTINGS_FIELDS}
+            changed.update(updated_at=timezone.now(), updated_by_id=request.user.id)
+            # One UPDATE of just the submitted columns on the singleton row.
+            # update() bypasses post_save, so drop the cached copy here.
+            if SecuritySettings.objects.update(**changed):
+                SecuritySettings.clear_cached_settings()
+            else:
+                SecuritySettings.objects.create(**changed)
         
         return Response({'message': 'Security settings updated successfully'})
     except Exception as e:
@@ -2420,18 +2604,18 @@ def detect_faces_hof(request):
         if 'image' in request.FILES:
             image_file = request.FILES['image']
             
-            # Save temporarily
-            temp_path = f'/tmp/{image_file.name}'
-            with open(temp_path, 'wb+') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
+            # Decode straight from the upload; the detector takes arrays as
+            # well as paths, so no temp file round-trip is needed
+            image = cv2.imdecode(np.frombuffer(image_file.read(), np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Could not decode image'
+                }, status=400)
             
             # Detect faces
             detector = AdaptiveFaceDetector()
-            faces, metrics = detector.detect_faces_adaptive(temp_path, return_metrics=True)
-            
-            # Clean up
-            os.remove(temp_path)
+            faces, metrics = detector.detect_faces_adaptive(image, return_metrics=True)
             
             return JsonResponse({
                 'success': True,
@@ -2487,47 +2671,37 @@ def detect_faces_single_person(request):
                 'error': 'Image file too large. Maximum size is 10MB.'
             }, status=400)
         
-        import tempfile
-        import uuid
-        temp_filename = f"single_person_{uuid.uuid4()}.jpg"
-        temp_dir = getattr(settings, 'HOF_TEMP_DIR', '/tmp')
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_path = os.path.join(temp_dir, temp_filename)
+        # Decode straight from the upload, as detect_faces_hof does, instead
+        # of copying it chunk by chunk to a temp file for the detector to reread
+        image = cv2.imdecode(np.frombuffer(image_file.read(), np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Could not decode image'
+            }, status=400)
         
-        try:
-            with open(temp_path, 'wb+') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
-            
-            # Use single-person mode explicitly
-            from core.adaptive_detector import AdaptiveFaceDetector
-            detector = AdaptiveFaceDetector()
-            faces, metrics = detector.detect_faces_adaptive(
-                temp_path, 
-                return_metrics=True, 
-                single_person_mode=True  # FORCE single-person mode
-            )
-            
-            # Enhanced response for single-person scenarios
-            response_data = {
-                'success': True,
-                'faces_detected': len(faces),
-                'faces': faces,
-                'metrics': metrics,
-                'single_person_result': self._analyze_single_person_result(faces, metrics),
-                'recommendations': self._get_single_person_recommendations(faces, metrics)
-            }
-                
-            return JsonResponse(response_data)
+        # Use single-person mode explicitly
+        from core.adaptive_detector import AdaptiveFaceDetector
+        detector = AdaptiveFaceDetector()
+        faces, metrics = detector.detect_faces_adaptive(
+            image, 
+            return_metrics=True, 
+            single_person_mode=True  # FORCE single-person mode
+        )
+        
+        # Enhanced response for single-person scenarios
+        response_data = {
+            'success': True,
+            'faces_detected': len(faces),
+            'faces': faces,
+            'metrics': metrics,
+            'single_person_result': self._analyze_single_person_result(faces, metrics),
+            'recommendations': self._get_single_person_recommendations(faces, metrics)
+        }
             
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        return JsonResponse(response_data)
             
     except Exception as e:
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
-            
         return JsonResponse({
             'success': False,
             'error': f'Single-person detection failed: {str(e)}'
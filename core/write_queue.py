@@ -0,0 +1,119 @@
+# core/write_queue.py - Background writer for fire-and-forget model rows
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+# Most rows one bulk_create call writes
+BATCH_SIZE = 256
+
+# bulk_create attempts per batch when the database reports contention (SQLite's
+# "database is locked"), and the delay before the first retry, doubled each time
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 0.1
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue(instance):
+    """
+    Save an unsaved model instance from the background writer
+
+    The row is written with bulk_create, batched with whatever else is queued
+    at the time, so save() overrides and post_save signals don't run. Only use
+    this for rows nothing reads back during the request, such as audit logs.
+    Rows still queued when the process is killed are lost; call flush() to
+    write them on the calling thread (e.g. in tests).
+    """
+    _ensure_worker()
+    _queue.put(instance)
+
+
+def flush():
+    """Write every queued row now, on the calling thread"""
+    while True:
+        batch = _drain(block=False)
+        if not batch:
+            return
+        _write(batch)
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name='write-queue', daemon=True)
+            _worker.start()
+            atexit.register(flush)
+
+
+def _drain(block):
+    """Up to BATCH_SIZE queued rows; waits for the first one if block is set"""
+    batch = []
+    try:
+        batch.append(_queue.get(block=block))
+        while len(batch) < BATCH_SIZE:
+            batch.append(_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _write(batch):
+    by_model = defaultdict(list)
+    for instance in batch:
+        by_model[type(instance)].append(instance)
+
+    for model, instances in by_model.items():
+        try:
+            _bulk_create(model, instances)
+        except Exception:
+            logger.warning(
+                "Background write of %d %s rows failed, saving them one by one",
+                len(instances), model.__name__, exc_info=True
+            )
+            _save_each(instances)
+
+
+def _bulk_create(model, instances):
+    """bulk_create, retried with backoff while the database is contended"""
+    delay = RETRY_DELAY
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        try:
+            model.objects.bulk_create(instances)
+            return
+        except OperationalError:
+            if attempt == WRITE_ATTEMPTS:
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+
+def _save_each(instances):
+    """Save rows individually so one bad row doesn't lose the rest of its batch"""
+    for instance in instances:
+        try:
+            instance.save()
+        except Exception:
+            logger.exception("Dropping %s row that could not be saved", type(instance).__name__)
+
+
+def _run():
+    while True:
+        batch = _drain(block=True)
+        try:
+            _write(batch)
+        finally:
+            # Release the connection (and on SQLite any lock) between batches,
+            # so request threads aren't kept waiting on this one
+            connection.close()
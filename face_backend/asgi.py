@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'face_backend.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings
+
+if getattr(settings, 'FACE_RECOGNITION_WARM_UP', False):
+    # Only servers load this module, so management commands don't pay for it
+    from core import face_utils
+    face_utils.warm_up()
@@ -220,7 +220,18 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # orjson-backed JSON (falls back to DRF's encoder without orjson)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # orjson-backed JSON bodies; form and multipart uploads as before
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # Media files for model storage
@@ -287,6 +298,30 @@ HOF_QUALITY_THRESHOLDS = {
 # Temp directory for image processing
 HOF_TEMP_DIR = BASE_DIR / 'temp'
 
+# Worker processes that compute face encodings off the request thread (0 = inline)
+FACE_ENCODING_WORKERS = 2
+FACE_ENCODING_TIMEOUT = 30  # seconds
+# Most images one recognize-faces request may upload; each holds a worker for
+# its whole encoding, so larger batches are rejected rather than queued
+FACE_BATCH_MAX_IMAGES = 20
+# Start the encoding workers and load dlib when the WSGI/ASGI app loads, not on
+# the first recognition request (runserver reloads would pay for it each time)
+FACE_RECOGNITION_WARM_UP = not DEBUG
+
+# Decoded student encodings, shared between worker processes via memory-mapped
+# .npy files. The files are the decrypted biometric data, so this stays off
+# unless set to an absolute path outside the project that only this user can
+# open (mode 0700), ideally on a tmpfs, e.g. '/dev/shm/face_backend_encodings'.
+FACE_ENCODING_CACHE_DIR = None
+# Seconds a worker reuses its encoding matrix before checking the students table
+# for changes made by other workers (its own saves are picked up immediately)
+FACE_ENCODING_CACHE_TTL = 5
+
+# Write audit log rows (UserActivity) from a background thread in batches.
+# Off by default: queued rows are lost if the process is killed, and on SQLite
+# the writer thread competes with requests for the database lock.
+ACTIVITY_LOG_IN_BACKGROUND = False
+
 # Logging configuration
 LOGGING = {
     'version': 1,